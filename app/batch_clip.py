@@ -0,0 +1,191 @@
+"""
+批量处理一个目录下的字幕：load_text_from_srt -> chunked_run_model（整理成文章）
+-> run_model（按剪辑提示词挑片段，可选）-> invert_find（反查出剪辑字幕），结果写成 JSONL。
+
+每个文件按 (相对路径, 内容句柄) 记录进度：已经写进输出文件的跳过，
+做完一步的中间结果写在 <output>.partial，中断后重新运行会从上次完成的步骤继续。
+
+用法（在仓库根目录）：
+python -m app.batch_clip notebooks/SrtFiles -o batch_results.jsonl --template-id srt_chunk_prompt/pairs_4 \
+    --clip-system-prompt-file prompts/clip.txt --workers 2
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+
+from app.utils.functions import chunked_run_model, invert_find, load_text_from_srt, run_model
+
+
+async def last_output(outputs):
+    out = ''
+    async for out in outputs:
+        pass
+    return out
+
+
+def read_jsonl(path):
+    records = []
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # 中断时写了一半的最后一行
+                        continue
+    return records
+
+
+def append_jsonl(path, record):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def find_srt_files(directory, pattern='*.srt', recursive=False):
+    pattern = os.path.join(directory, '**', pattern) if recursive else os.path.join(directory, pattern)
+    return sorted(glob.glob(pattern, recursive=recursive))
+
+
+class BatchRunner:
+    """
+    用最多 workers 个并发任务处理字幕文件；模型请求本身还受 ollama_pool 每个模型的并发上限约束。
+
+    :param output: 结果 JSONL 路径，每个文件一行
+    :param clip_system_prompt: 为空时跳过剪辑这一步，直接对整理后的文章做 invert_find
+    """
+
+    def __init__(self, output, model, system_prompt='', user_prompt='{}', template_id=None,
+                 clip_system_prompt='', clip_user_prompt='{}', temperature=0.1, num_predict=1024,
+                 clip_num_ctx=20000, clip_num_predict=1024, chunk_tokens=None, similarity=0.8,
+                 workers=2, use_cache=True):
+        self.output = output
+        self.partial = output + '.partial'
+        self.model = model
+        self.system_prompt = system_prompt
+        self.user_prompt = user_prompt
+        self.template_id = template_id
+        self.clip_system_prompt = clip_system_prompt
+        self.clip_user_prompt = clip_user_prompt
+        self.temperature = temperature
+        self.num_predict = num_predict
+        self.clip_num_ctx = clip_num_ctx
+        self.clip_num_predict = clip_num_predict
+        self.chunk_tokens = chunk_tokens
+        self.similarity = similarity
+        self.workers = workers
+        self.use_cache = use_cache
+        self.done = {(r['file'], r['handle']) for r in read_jsonl(self.output) if not r.get('error')}
+        self._partial = {}
+        for record in read_jsonl(self.partial):
+            self._partial.setdefault((record['file'], record['handle']), {}).update(record)
+
+    def _checkpoint(self, key, **stage):
+        state = self._partial.setdefault(key, {'file': key[0], 'handle': key[1]})
+        state.update(stage)
+        append_jsonl(self.partial, {'file': key[0], 'handle': key[1], **stage})
+        return state
+
+    async def process(self, srt_file, relpath):
+        started = time.perf_counter()
+        record = {'file': relpath, 'handle': None, 'model': self.model, 'template_id': self.template_id}
+        try:
+            # 读不了的字幕（编码不对、文件损坏）只让这个文件失败，不影响整批
+            _, handle = load_text_from_srt(srt_file)
+            key = (relpath, handle)
+            if key in self.done:
+                return None
+            record['handle'] = handle
+            state = self._partial.get(key, {})
+            if 'article' not in state:
+                article = await last_output(chunked_run_model(
+                    self.system_prompt, handle, self.model, self.user_prompt, temperature=self.temperature,
+                    num_predict=self.num_predict, chunk_tokens=self.chunk_tokens, use_cache=self.use_cache,
+                    template_id=self.template_id))
+                state = self._checkpoint(key, article=article)
+            if self.clip_system_prompt and 'clip' not in state:
+                clip = await last_output(run_model(
+                    self.clip_system_prompt, state['article'], self.model, self.clip_user_prompt,
+                    temperature=self.temperature, num_ctx=self.clip_num_ctx, num_predict=self.clip_num_predict,
+                    use_cache=self.use_cache))
+                state = self._checkpoint(key, clip=clip)
+            # invert_find 要在 srt_cache 里重新解析字幕，放到线程里做
+            clip_srt = await asyncio.to_thread(
+                invert_find, state.get('clip', state['article']), handle, self.similarity * 100)
+            record.update(article=state['article'], clip=state.get('clip'), clip_srt=clip_srt, error=None)
+        except Exception as e:
+            record['error'] = repr(e)
+        record['elapsed_s'] = round(time.perf_counter() - started, 3)
+        append_jsonl(self.output, record)
+        if not record['error']:
+            self.done.add(key)
+        return record
+
+    async def run(self, srt_files, root):
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def bounded(srt_file):
+            async with semaphore:
+                record = await self.process(srt_file, os.path.relpath(srt_file, root))
+                if record is None:
+                    print(f'skip  {srt_file}')
+                else:
+                    print(f'{"fail" if record["error"] else "done"}  {srt_file} ({record["elapsed_s"]}s)'
+                          + (f': {record["error"]}' if record['error'] else ''))
+                return record
+
+        return await asyncio.gather(*(bounded(srt_file) for srt_file in srt_files))
+
+
+def read_prompt(text, path):
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batch SRT -> article -> clip processing')
+    parser.add_argument('directory')
+    parser.add_argument('-o', '--output', default='batch_results.jsonl')
+    parser.add_argument('--pattern', default='*.srt')
+    parser.add_argument('--recursive', action='store_true')
+    parser.add_argument('--model', default='qwen2.5:latest')
+    parser.add_argument('--template-id', help='system prompt from the template registry, e.g. srt_chunk_prompt/pairs_4')
+    parser.add_argument('--system-prompt', default='')
+    parser.add_argument('--system-prompt-file')
+    parser.add_argument('--user-prompt', default='{}')
+    parser.add_argument('--clip-system-prompt', default='')
+    parser.add_argument('--clip-system-prompt-file')
+    parser.add_argument('--clip-user-prompt', default='{}')
+    parser.add_argument('--temperature', type=float, default=0.1)
+    parser.add_argument('--num-predict', type=int, default=1024)
+    parser.add_argument('--clip-num-predict', type=int, default=1024)
+    parser.add_argument('--chunk-tokens', type=int)
+    parser.add_argument('--similarity', type=float, default=0.8)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--no-cache', action='store_true')
+    args = parser.parse_args()
+
+    runner = BatchRunner(
+        args.output, args.model,
+        system_prompt=read_prompt(args.system_prompt, args.system_prompt_file),
+        user_prompt=args.user_prompt, template_id=args.template_id,
+        clip_system_prompt=read_prompt(args.clip_system_prompt, args.clip_system_prompt_file),
+        clip_user_prompt=args.clip_user_prompt, temperature=args.temperature, num_predict=args.num_predict,
+        clip_num_predict=args.clip_num_predict, chunk_tokens=args.chunk_tokens, similarity=args.similarity,
+        workers=args.workers, use_cache=not args.no_cache,
+    )
+    srt_files = find_srt_files(args.directory, args.pattern, args.recursive)
+    print(f'{len(srt_files)} srt files, {len(runner.done)} already done')
+    records = asyncio.run(runner.run(srt_files, args.directory))
+    failed = sum(1 for record in records if record and record['error'])
+    print(f'{len(records) - records.count(None)} processed, {records.count(None)} skipped, {failed} failed')
+
+
+if __name__ == '__main__':
+    main()
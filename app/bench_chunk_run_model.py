@@ -0,0 +1,49 @@
+"""
+分块推理性能对比：逐块顺序调用 vs 并发分发 + 按顺序合并，使用本地假 LLM 服务。
+
+用法（在仓库根目录）：python -m app.bench_chunk_run_model [块数] [并发数]
+"""
+import asyncio
+import sys
+import time
+
+from app.fake_llm_server import FakeLLMServer
+from app.utils.llm import OllamaPool, ollama_generate, ordered_fan_out
+
+
+async def run_chunks(pool, chunks, concurrency, num_predict):
+    def generate(text):
+        async def accumulate():
+            out = ''
+            async for delta in ollama_generate('system', text, 'fake', '{}', options={'num_predict': num_predict}, pool=pool):
+                out += delta
+                yield out
+        return accumulate()
+
+    start = time.perf_counter()
+    first = None
+    merged = ''
+    async for merged in ordered_fan_out(chunks, generate, concurrency=concurrency):
+        if first is None:
+            first = time.perf_counter() - start
+    return merged, first, time.perf_counter() - start
+
+
+async def bench(n_chunks, concurrency, num_predict=40):
+    server = FakeLLMServer(latency_ms=200, tokens_per_sec=100)
+    url = server.start()
+    chunks = [f'chunk{i} ' * 5 for i in range(n_chunks)]
+    try:
+        for label, limit in (('sequential', 1), (f'concurrent x{concurrency}', concurrency)):
+            pool = OllamaPool(host=url, default_concurrency=limit)
+            merged, first, total = await run_chunks(pool, chunks, limit, num_predict)
+            await pool.aclose()
+            ordered = [line.split()[0] for line in merged.splitlines()] == [c.split()[0] for c in chunks]
+            print(f'{label:16s}: first output {first * 1000:7.1f} ms, total {total * 1000:8.1f} ms, in order: {ordered}')
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    asyncio.run(bench(*(args + [8, 4][len(args):])))
@@ -0,0 +1,44 @@
+"""
+导入 app.utils.functions 的耗时，用 python -X importtime 统计，按累计耗时列出最慢的模块。
+
+用法（在仓库根目录）：python -m app.bench_import_time [--module app.utils.functions] [--top 15]
+"""
+import argparse
+import subprocess
+import sys
+
+
+def import_times(module):
+    """在新的解释器里导入 module，返回 [(累计微秒, 自身微秒, 模块名), ...]"""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          capture_output=True, text=True, check=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # 去掉分隔符后的一个空格，剩下的缩进表示嵌套层数
+        rows.append((int(cumulative_us), int(self_us), name[1:].rstrip()))
+    return rows
+
+
+def total_ms(rows, module):
+    """导入 module 所在的顶层包花的时间，不含解释器启动时的 site 等模块"""
+    package = module.split('.')[0]
+    return sum(cumulative for cumulative, _, name in rows if name.split('.')[0] == package) / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='app.utils.functions')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    rows = import_times(args.module)
+    print(f'{args.module}: {total_ms(rows, args.module):.1f} ms total')
+    for cumulative, self_time, name in sorted(rows, reverse=True)[:args.top]:
+        print(f'{cumulative / 1000:9.1f} ms {self_time / 1000:9.1f} ms  {name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+invert_find 性能对比：原始逐行 fuzz.ratio 循环 vs 倒排索引 vs cdist 批量对齐。
+
+用法（在仓库根目录）：python -m app.bench_invert_find [字幕行数]
+"""
+import random
+import sys
+import time
+
+import pysubs2
+from rapidfuzz import fuzz
+
+from app.utils.matcher import SubtitleMatcher, split_segments
+
+ALPHABET = '我们今年第季度营收同比增长利润率毛率市场客户产品数据中心汽车交付电池成本价格订单'
+
+
+def make_subs(n_lines, rnd):
+    subs = pysubs2.SSAFile()
+    for i in range(n_lines):
+        text = ''.join(rnd.choices(ALPHABET, k=rnd.randint(8, 20)))
+        subs.append(pysubs2.SSAEvent(start=i * 2000, end=i * 2000 + 1800, text=text))
+    return subs
+
+
+def make_short_text(subs, n_quotes, rnd):
+    # 模拟 LLM 摘录：按顺序引用字幕原文，每条引用由几行字幕拼成并做少量改动
+    picks = sorted(rnd.sample(range(len(subs) - 3), n_quotes))
+    lines = []
+    for p in picks:
+        parts = []
+        for line in subs[p:p + 3]:
+            text = list(line.text)
+            text[rnd.randrange(len(text))] = rnd.choice(ALPHABET)
+            parts.append(''.join(text))
+        # LLM 还会写出字幕里没有的概括性文字，这些片段在原始循环里要扫描全部字幕
+        parts.append(''.join(rnd.choices(ALPHABET, k=rnd.randint(8, 20))))
+        lines.append(f'- "{"，".join(parts)}"')
+    return '\n'.join(lines)
+
+
+def legacy_loop(segs, subs, fuzz_param):
+    last_cursor = 0
+    out = []
+    for seg in segs:
+        for i in range(last_cursor, last_cursor + len(subs)):
+            current_index = i % len(subs)
+            if fuzz.ratio(seg, subs[current_index].text) > fuzz_param:
+                last_cursor = current_index + 1
+                out.append(current_index)
+                break
+    return out
+
+
+def indexed_loop(segs, matcher, fuzz_param):
+    last_cursor = 0
+    out = []
+    for seg in segs:
+        current_index = matcher.find(seg, fuzz_param, last_cursor)
+        if current_index is not None:
+            last_cursor = current_index + 1
+            out.append(current_index)
+    return out
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main(n_lines=3000, n_quotes=100, fuzz_param=80):
+    rnd = random.Random(0)
+    subs = make_subs(n_lines, rnd)
+    segs = split_segments(make_short_text(subs, n_quotes, rnd))
+
+    legacy, t_legacy = timed(legacy_loop, segs, subs, fuzz_param)
+    matcher, t_build = timed(SubtitleMatcher, [line.text for line in subs])
+    indexed, t_indexed = timed(indexed_loop, segs, matcher, fuzz_param)
+    batch, t_batch = timed(matcher.align, segs, fuzz_param)
+
+    print(f'{n_lines} subtitle lines, {len(segs)} segments, fuzz_param={fuzz_param}')
+    print(f'legacy loop : {t_legacy * 1000:9.1f} ms  matched {len(legacy)}')
+    print(f'index build : {t_build * 1000:9.1f} ms')
+    print(f'indexed     : {t_indexed * 1000:9.1f} ms  matched {len(indexed)}  same as legacy: {indexed == legacy}')
+    print(f'batch align : {t_batch * 1000:9.1f} ms  matched {len(batch)}')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,54 @@
+"""
+各模型后端的首 token 延迟和吞吐量。
+
+默认测试进程内的 fake 后端，以及指向本地假 LLM 服务的 local（Ollama）后端；
+加 --real 时再测试 OLLAMA_HOST 上真实的 Ollama 服务。
+
+用法（在仓库根目录）：python -m app.bench_llm_backends [--model qwen2.5:latest] [--num-predict 200] [--real]
+"""
+import argparse
+import asyncio
+import time
+
+from app.fake_llm_server import FakeLLMServer
+from app.utils.backends import FakeBackend, OllamaBackend
+from app.utils.llm import OllamaPool, build_messages
+
+
+async def measure(backend, model, num_predict, runs=3):
+    messages = build_messages('你是一名财经编辑。', '请概括这段财报电话会的内容：营收同比增长，毛利率稳定。', '{}')
+    for _ in range(runs):
+        start = time.perf_counter()
+        first = None
+        tokens = 0
+        async for _ in backend.stream_chat(model, messages, {'num_predict': num_predict, 'temperature': 0}):
+            if first is None:
+                first = time.perf_counter() - start
+            tokens += 1
+        total = time.perf_counter() - start
+        rate = (tokens - 1) / (total - first) if tokens > 1 and total > first else 0
+        print(f'{backend.name:6s} {model:18s} ttft {first * 1000:8.1f} ms  total {total * 1000:8.1f} ms  '
+              f'{tokens:4d} chunks  {rate:7.1f} chunks/s')
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default='qwen2.5:latest')
+    parser.add_argument('--num-predict', type=int, default=100)
+    parser.add_argument('--real', action='store_true', help='also benchmark the Ollama server at OLLAMA_HOST')
+    args = parser.parse_args()
+
+    await measure(FakeBackend(latency_ms=200, tokens_per_sec=100), args.model, args.num_predict)
+    server = FakeLLMServer(latency_ms=200, tokens_per_sec=100)
+    pool = OllamaPool(host=server.start())
+    try:
+        await measure(OllamaBackend(pool), args.model, args.num_predict)
+    finally:
+        await pool.aclose()
+        server.shutdown()
+    if args.real:
+        await measure(OllamaBackend(), args.model, args.num_predict)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,24 @@
+import pysubs2
+import pytest
+
+
+def srt_text(lines):
+    """每行一条字幕，第 i 行从 i 秒开始、持续 900 毫秒"""
+    subs = pysubs2.SSAFile()
+    for i, text in enumerate(lines):
+        subs.append(pysubs2.SSAEvent(start=i * 1000, end=i * 1000 + 900, text=text))
+    return subs.to_string('srt')
+
+
+@pytest.fixture
+def make_srt():
+    return srt_text
+
+
+@pytest.fixture
+def write_srt():
+    def write(path, lines):
+        path.write_text(srt_text(lines), encoding='utf-8')
+        return path
+
+    return write
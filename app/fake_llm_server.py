@@ -0,0 +1,97 @@
+"""
+本地假 LLM 服务，实现 Ollama 的 /api/chat 流式接口，用于离线压测和基准测试。
+
+输出是确定性的：把用户输入按空白切分后循环输出，直到 num_predict 个 token。
+
+用法（在仓库根目录）：python -m app.fake_llm_server --port 11435 --latency-ms 200 --tokens-per-sec 50
+然后用 OLLAMA_HOST=http://127.0.0.1:11435 启动 fin_clip.py，不用改代码就可以压测整个流程。
+"""
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.utils.backends import fake_tokens
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json_line(self, obj):
+        data = (json.dumps(obj, ensure_ascii=False) + '\n').encode('utf-8')
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def do_POST(self):
+        if self.path != '/api/chat':
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        options = body.get('options') or {}
+        tokens = list(fake_tokens(body.get('messages') or [], options.get('num_predict')))
+        server = self.server
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        time.sleep(server.latency_ms / 1000)
+        interval = 1 / server.tokens_per_sec if server.tokens_per_sec > 0 else 0
+        for token in tokens:
+            self._send_json_line({
+                'model': body.get('model', ''),
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'message': {'role': 'assistant', 'content': token},
+                'done': False,
+            })
+            if interval:
+                time.sleep(interval)
+        self._send_json_line({
+            'model': body.get('model', ''),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'message': {'role': 'assistant', 'content': ''},
+            'done': True,
+            'done_reason': 'stop',
+            'eval_count': len(tokens),
+        })
+        self.wfile.write(b'0\r\n\r\n')
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=200, tokens_per_sec=50):
+        super().__init__((host, port), FakeLLMHandler)
+        self.latency_ms = latency_ms
+        self.tokens_per_sec = tokens_per_sec
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        """在后台线程里运行，返回服务地址"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.url
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Ollama-compatible LLM server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--latency-ms', type=float, default=200)
+    parser.add_argument('--tokens-per-sec', type=float, default=50)
+    args = parser.parse_args()
+    server = FakeLLMServer(args.host, args.port, args.latency_ms, args.tokens_per_sec)
+    print(f'fake llm server listening on {server.url}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
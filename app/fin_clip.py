@@ -1,6 +1,11 @@
 import gradio as gr
 from utils.functions import *
 from utils.dbs import *
+from utils.chunker import parse_chunk_size
+from utils.serving import serving_config, event_limits, queue_kwargs
+
+# 生产模式用 app/serve.py 启动多个进程，参数见 utils/serving.py
+serving = serving_config()
 
 
 srt_file = gr.File()
@@ -14,10 +19,11 @@ srt_chunk_prompt_insert_btn = gr.Button("Insert")
 
 
 
-srt_chunk_size = gr.Textbox(label="Clip SRT File Chunk Size")
-srt_chunk_similarity = gr.Slider(minimum=0, maximum=1, step=0.1, label="Clip Similarity")
+srt_chunk_size = gr.Textbox(label="Clip SRT File Chunk Size (tokens, empty for model default)")
+srt_chunk_similarity = gr.Slider(minimum=0, maximum=1, step=0.1, value=0.8, label="Clip Similarity")
 srt_content = gr.Textbox(label="SRT File Content")
-srt_content_with_ts = gr.Textbox(label="SRT File Content with Timestamp", visible=False)
+# 只保存 srt_cache 的句柄，不再把整份字幕来回传给浏览器
+srt_content_with_ts = gr.Textbox(label="SRT File Handle", visible=False)
 srt_text_output = gr.Textbox(label="SRT File Output line by line")
 srt_chunk_button = gr.Button("Go!")
 srt_chunk_stop_btn = gr.Button("Stop")
@@ -30,10 +36,20 @@ clip_usr_prompt = gr.Textbox(label="Clip User Prompt", value='{}')
 clip_button = gr.Button("Clip")
 clip_output_text = gr.Textbox(label="Clip Output")
 
+clip_video_file = gr.Textbox(label="Source Video")
+clip_srt_output = gr.Textbox(label="Clip SRT")
+clip_export_btn = gr.Button("Export")
+clip_export_stop_btn = gr.Button("Stop Export")
+clip_export_status = gr.Textbox(label="Export Progress")
+clip_export_file = gr.File(label="Exported Clip")
+
 llm_model_selected = gr.Dropdown(["qwen2.5:latest", "qwen2.5:14b"], label="Model", value="qwen2.5:latest")
 llm_context_length = gr.Slider(minimum=0, maximum=30000, step=100, value=20000, label="LLM Context Length")
 llm_temperature = gr.Slider(minimum=0, maximum=1, step=0.1, value=0, label="LLM Temperature")
 llm_max_tokens = gr.Slider(minimum=0, maximum=10000, value=1024, step=1, label="LLM Max Tokens")
+llm_use_cache = gr.Checkbox(value=True, label="Use LLM Cache")
+llm_metrics_table = gr.Dataframe(label="LLM Call Metrics", interactive=False)
+llm_metrics_refresh_btn = gr.Button("Refresh Metrics")
 
 def init_chunk_prompt_templates(key, db_path):
     descs, prompts = query_prompt(key, db_path)
@@ -44,6 +60,27 @@ import re
 def get_word_count(s):
     words = re.findall(r'\b\w+\b', s)
     return len(words)
+
+async def run_model_ui(system_prompt, full_text, model_select, user_prompt, temperature, num_ctx, num_predict, use_cache):
+    # 模型只返回合并后的增量，这里拼接后交给 Gradio；Gradio 流式更新时只把新增的部分发给浏览器
+    parts = []
+    async for delta in run_model(system_prompt, full_text, model_select, user_prompt, temperature, num_ctx, num_predict, use_cache=use_cache, stream=True):
+        parts.append(delta)
+        yield "".join(parts)
+
+async def chunked_run_model_ui(system_prompt, srt_handle, model_select, user_prompt, temperature, num_predict, chunk_size, use_cache):
+    chunk_tokens = parse_chunk_size(chunk_size)
+    if chunk_tokens is None and (chunk_size or '').strip():
+        gr.Warning(f'Chunk size {chunk_size!r} is not a positive integer, using the model default')
+    async for out in chunked_run_model(system_prompt, srt_handle, model_select, user_prompt, temperature, num_predict, chunk_tokens=chunk_tokens, use_cache=use_cache):
+        yield out
+
+def llm_metrics_summary():
+    headers, rows = llm_metrics.summary_table()
+    return gr.Dataframe(value=rows, headers=headers)
+
+def find_clip_srt(short_text, srt_handle, similarity):
+    return invert_find(short_text, srt_handle, similarity * 100)
     
 with gr.Blocks() as demo:
     g_usr_prompt = gr.State('{}')
@@ -60,6 +97,7 @@ with gr.Blocks() as demo:
         llm_context_length.render()
         llm_temperature.render()
         llm_max_tokens.render()
+        llm_use_cache.render()
 # 把字幕转换为分段的文章
     
     with gr.Row():
@@ -68,6 +106,7 @@ with gr.Blocks() as demo:
             srt_content.render()
             srt_length.render()
             srt_length_btn.render()
+            srt_chunk_size.render()
             srt_content_with_ts.render()
 
         with gr.Column(scale=4):
@@ -85,11 +124,11 @@ with gr.Blocks() as demo:
         srt_chunk_button.render()
         srt_chunk_stop_btn.render()
     
-    srt_length_btn.click(get_word_count, srt_content, srt_length)
+    srt_length_btn.click(get_word_count, srt_content, srt_length, **event_limits(serving, 'text'))
     srt_chunk_prompt_templates.select(lambda x,y : y[x], [srt_chunk_prompt_templates, srt_chunk_prompt_tpl_list], srt_chunk_prompt)
-    srt_chunk_prompt_insert_btn.click(insert_prompt, [srt_chunk_prompt, srt_chunk_prompt_desc, srt_chunk_prompt_key, g_db_path])
-    srt_explorer.change(load_text_from_srt, srt_explorer, [srt_content, srt_content_with_ts])
-    s_c_e = srt_chunk_button.click(run_model,[srt_chunk_prompt, srt_content, llm_model_selected, g_usr_prompt, llm_temperature, llm_context_length, llm_max_tokens], srt_text_output) #system_prompt, full_text, model_select, user_prompt, 
+    srt_chunk_prompt_insert_btn.click(insert_prompt, [srt_chunk_prompt, srt_chunk_prompt_desc, srt_chunk_prompt_key, g_db_path], **event_limits(serving, 'text'))
+    srt_explorer.change(load_text_from_srt, srt_explorer, [srt_content, srt_content_with_ts], **event_limits(serving, 'text'))
+    s_c_e = srt_chunk_button.click(chunked_run_model_ui,[srt_chunk_prompt, srt_content_with_ts, llm_model_selected, g_usr_prompt, llm_temperature, llm_max_tokens, srt_chunk_size, llm_use_cache], srt_text_output, **event_limits(serving, 'llm')) #system_prompt, full_text, model_select, user_prompt, 
     srt_chunk_stop_btn.click(None, None, None, cancels=[s_c_e])
 # 生成Clip
     with gr.Row():
@@ -101,7 +140,26 @@ with gr.Blocks() as demo:
             clip_usr_prompt.render()
             clip_button.render()
     clip_output_text.render()
-    clip_button.click(run_model,[clip_sys_prompt, srt_text_output, llm_model_selected, clip_usr_prompt, llm_temperature, llm_context_length, llm_max_tokens], clip_output_text)
-
-    
-demo.launch(server_port=17777)
\ No newline at end of file
+    clip_button.click(run_model_ui,[clip_sys_prompt, srt_text_output, llm_model_selected, clip_usr_prompt, llm_temperature, llm_context_length, llm_max_tokens, llm_use_cache], clip_output_text, **event_limits(serving, 'llm'))
+# 导出视频：编码在后台进程里进行，这里只流式显示进度
+    with gr.Row():
+        with gr.Column():
+            clip_video_file.render()
+            srt_chunk_similarity.render()
+            clip_srt_output.render()
+        with gr.Column():
+            clip_export_btn.render()
+            clip_export_stop_btn.render()
+            clip_export_status.render()
+            clip_export_file.render()
+    c_e_e = clip_export_btn.click(find_clip_srt, [clip_output_text, srt_content_with_ts, srt_chunk_similarity], clip_srt_output, **event_limits(serving, 'text')).then(gen_download_video, [clip_srt_output, clip_video_file], [clip_export_status, clip_export_file], **event_limits(serving, 'render'))
+    clip_export_stop_btn.click(None, None, None, cancels=[c_e_e])
+# 模型调用指标汇总，明细在 logs/llm_calls.jsonl
+    with gr.Accordion("LLM Metrics", open=False):
+        llm_metrics_table.render()
+        llm_metrics_refresh_btn.render()
+    llm_metrics_refresh_btn.click(llm_metrics_summary, None, llm_metrics_table, **event_limits(serving, 'text'))
+
+# render_queue 用 spawn 启动编码进程，子进程会重新导入本模块，不能在导入时启动服务
+if __name__ == '__main__':
+    demo.queue(**queue_kwargs(serving)).launch(server_name=serving.host, server_port=serving.port)
\ No newline at end of file
@@ -0,0 +1,72 @@
+"""
+生产模式：启动多个 fin_clip.py 进程，每个进程监听一个端口，前面用反向代理做负载均衡。
+
+Gradio 的会话和队列事件流要落在同一个进程上，代理需要按客户端粘滞（例如 nginx 的 ip_hash）。
+各进程共用当前目录下的 LLM 输出缓存（db/llm_cache.sqlite）、渲染缓存（stream/）
+和 --shared-dir 下的字幕缓存，同一份字幕或者同样的剪辑在哪个进程上都只算一次。
+
+用法（在仓库根目录）：
+python -m app.serve --workers 3 --port 17777 --host 0.0.0.0 --shared-dir db/shared \
+    --llm-concurrency 4 --render-concurrency 1 --max-queue-size 64
+
+每个进程对 Ollama 的并发请求数由环境变量 FIN_CLIP_OLLAMA_CONCURRENCY（每个模型的默认值）和
+FIN_CLIP_OLLAMA_MODEL_CONCURRENCY（按模型覆盖，例如 qwen2.5:14b=1,qwen2.5:latest=3）决定。
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+
+from app.utils.serving import serving_config, worker_env
+
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fin_clip.py')
+
+
+def main():
+    defaults = serving_config()
+    parser = argparse.ArgumentParser(description='Run several fin_clip app workers')
+    parser.add_argument('--host', default=defaults.host)
+    parser.add_argument('--port', type=int, default=defaults.port, help='port of the first worker')
+    parser.add_argument('--workers', type=int, default=max(defaults.workers, 2))
+    parser.add_argument('--llm-concurrency', type=int, default=defaults.llm_concurrency)
+    parser.add_argument('--render-concurrency', type=int, default=defaults.render_concurrency)
+    parser.add_argument('--text-concurrency', type=int, default=defaults.text_concurrency)
+    parser.add_argument('--max-queue-size', type=int, default=defaults.max_queue_size or 0)
+    parser.add_argument('--shared-dir', default=defaults.shared_dir or 'db/shared')
+    args = parser.parse_args()
+
+    config = defaults._replace(
+        host=args.host, port=args.port, workers=args.workers,
+        llm_concurrency=args.llm_concurrency, render_concurrency=args.render_concurrency,
+        text_concurrency=args.text_concurrency, max_queue_size=args.max_queue_size or None,
+        shared_dir=args.shared_dir,
+    )
+    environ = dict(os.environ,
+                   FIN_CLIP_HOST=config.host,
+                   FIN_CLIP_LLM_CONCURRENCY=str(config.llm_concurrency),
+                   FIN_CLIP_RENDER_CONCURRENCY=str(config.render_concurrency),
+                   FIN_CLIP_TEXT_CONCURRENCY=str(config.text_concurrency),
+                   FIN_CLIP_MAX_QUEUE_SIZE=str(config.max_queue_size or 0))
+    workers = []
+    for i in range(config.workers):
+        env = worker_env(config, i, environ)
+        print(f'worker {i}: http://{config.host}:{env["FIN_CLIP_PORT"]}')
+        workers.append(subprocess.Popen([sys.executable, APP_SCRIPT], env=env))
+
+    def stop(signum, frame):
+        for worker in workers:
+            worker.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for worker in workers:
+            worker.wait()
+    except KeyboardInterrupt:
+        stop(None, None)
+        for worker in workers:
+            worker.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import asyncio
+
+from app.batch_clip import BatchRunner, append_jsonl, find_srt_files, read_jsonl
+from app.utils.functions import load_text_from_srt
+from app.utils.metrics import llm_metrics
+
+
+def test_batch_runner_resumes(tmp_path, monkeypatch, write_srt):
+    monkeypatch.setenv('FIN_CLIP_LLM_BACKEND', 'fake')
+    monkeypatch.setenv('FIN_CLIP_FAKE_LATENCY_MS', '0')
+    monkeypatch.setenv('FIN_CLIP_FAKE_TOKENS_PER_SEC', '0')
+    monkeypatch.setattr(llm_metrics, 'log_path', None)
+    srt_dir = tmp_path / 'srts'
+    srt_dir.mkdir()
+    write_srt(srt_dir / 'a.srt', ['营收增长', '利润率稳定'])
+    write_srt(srt_dir / 'b.srt', ['现金流改善'])
+    output = str(tmp_path / 'out.jsonl')
+
+    # a.srt 上次已经整理出文章，这次只做剩下的步骤
+    _, handle = load_text_from_srt(str(srt_dir / 'a.srt'))
+    append_jsonl(output + '.partial', {'file': 'a.srt', 'handle': handle, 'article': '"利润率稳定"'})
+
+    def run():
+        runner = BatchRunner(output, 'fake', num_predict=4, workers=2, use_cache=False)
+        return asyncio.run(runner.run(find_srt_files(str(srt_dir)), str(srt_dir)))
+
+    records = run()
+    assert [r['file'] for r in records] == ['a.srt', 'b.srt']
+    assert all(r['error'] is None for r in records)
+    assert records[0]['article'] == '"利润率稳定"' and '利润率稳定' in records[0]['clip_srt']
+    assert len(read_jsonl(output)) == 2
+    assert run() == [None, None]
+
+    with open(output, 'a', encoding='utf-8') as f:
+        f.write('{"file": "c.srt", "handle"')
+    assert len(read_jsonl(output)) == 2
+
+
+def test_batch_runner_records_unreadable_files(tmp_path, monkeypatch, write_srt):
+    monkeypatch.setenv('FIN_CLIP_LLM_BACKEND', 'fake')
+    monkeypatch.setenv('FIN_CLIP_FAKE_LATENCY_MS', '0')
+    monkeypatch.setenv('FIN_CLIP_FAKE_TOKENS_PER_SEC', '0')
+    monkeypatch.setattr(llm_metrics, 'log_path', None)
+    srt_dir = tmp_path / 'srts'
+    srt_dir.mkdir()
+    write_srt(srt_dir / 'a.srt', ['营收增长'])
+    (srt_dir / 'b.srt').write_bytes('1\n00:00:00,000 --> 00:00:00,900\n现金流改善\n'.encode('gbk'))
+    output = str(tmp_path / 'out.jsonl')
+
+    runner = BatchRunner(output, 'fake', num_predict=4, workers=2, use_cache=False)
+    records = asyncio.run(runner.run(find_srt_files(str(srt_dir)), str(srt_dir)))
+    assert records[0]['error'] is None
+    assert records[1]['file'] == 'b.srt' and 'UnicodeDecodeError' in records[1]['error']
+    assert sorted(r['file'] for r in read_jsonl(output)) == ['a.srt', 'b.srt']
@@ -1,9 +1,38 @@
+import json
+
 import pytest
-from app.utils.dbs import insert_prompt
+from app.utils.dbs import PromptStore, insert_prompt, query_prompt
 
-def test_insert_prompt():
+def test_insert_prompt(tmp_path):
     prompt = "test prompt"
     key = "test_key"
-    db_path = "test_db.db"
-    insert_prompt(prompt, key, db_path)
-    # Add assertions to verify the expected behavior of the function
\ No newline at end of file
+    db_path = str(tmp_path / "test_db.sqlite")
+    insert_prompt(prompt, "test desc", key, db_path)
+    insert_prompt("", "empty", key, db_path)
+    assert query_prompt(key, db_path) == [["test desc"], ["test prompt"]]
+    insert_prompt("second", "second desc", key, db_path)
+    assert query_prompt(key, db_path) == [["test desc", "second desc"], ["test prompt", "second"]]
+    assert query_prompt("other_key", db_path) == [[], []]
+
+def test_prompt_store_imports_tinydb_json(tmp_path):
+    json_path = tmp_path / "prompts.json"
+    json_path.write_text(json.dumps({"_default": {
+        "2": {"key": "k", "desc": "b", "prompt": "p2"},
+        "1": {"key": "k", "desc": "a", "prompt": "p1"},
+    }}))
+    store = PromptStore(str(json_path))
+    assert store.query("k") == [["a", "b"], ["p1", "p2"]]
+    store.close()
+    # 只在第一次创建时导入
+    assert PromptStore(str(json_path)).query("k") == [["a", "b"], ["p1", "p2"]]
+
+def test_prompt_store_sees_writes_from_other_connections(tmp_path):
+    # 两个 app 进程各有自己的 PromptStore
+    db_path = str(tmp_path / "prompts.sqlite")
+    reader, writer = PromptStore(db_path), PromptStore(db_path)
+    writer.insert("k", "a", "p1")
+    assert reader.query("k") == [["a"], ["p1"]]
+    writer.insert("k", "b", "p2")
+    assert reader.query("k") == [["a", "b"], ["p1", "p2"]]
+    reader.close()
+    writer.close()
@@ -0,0 +1,20 @@
+import subprocess
+import sys
+
+from app.bench_import_time import import_times, total_ms
+
+# 只有用到时才加载的依赖，不能出现在 app.utils.functions 的导入链里
+HEAVY_MODULES = ('moviepy', 'ffmpeg', 'dashscope', 'langchain_core', 'langchain_experimental', 'langchain_ollama',
+                 'pysubs2', 'rapidfuzz', 'numpy', 'pypinyin', 'ollama', 'httpx', 'proglog', 'pytz')
+
+
+def test_functions_import_is_lazy():
+    code = ('import sys, app.utils.functions; '
+            f'print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))')
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    assert out.strip() == ''
+
+
+def test_functions_import_time_budget():
+    elapsed = total_ms(import_times('app.utils.functions'), 'app.utils.functions')
+    assert 0 < elapsed < 500, elapsed
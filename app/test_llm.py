@@ -0,0 +1,251 @@
+import asyncio
+
+import pytest
+
+from app.fake_llm_server import FakeLLMServer
+from app.utils.backends import BackendError, DashScopeBackend, FakeBackend, OllamaBackend, get_backend
+from app.utils.llm import OllamaPool, pool_config, build_messages, ollama_generate, ordered_fan_out, throttle
+from app.utils.response_cache import ResponseCache
+from app.utils.chunker import chunk_lines, estimate_tokens, parse_chunk_size, token_budget
+from app.utils.metrics import MetricsRecorder, ModelCall
+
+
+def test_pool_reuses_client_and_limits_per_model():
+    pool = OllamaPool(max_concurrency={'qwen2.5:14b': 1}, default_concurrency=3)
+
+    async def check():
+        assert pool.client() is pool.client()
+        assert pool.semaphore('qwen2.5:14b') is pool.semaphore('qwen2.5:14b')
+        assert pool.semaphore('qwen2.5:14b')._value == 1
+        assert pool.semaphore('qwen2.5:latest')._value == 3
+        await pool.aclose()
+
+    asyncio.run(check())
+
+
+def test_pool_config_from_env():
+    assert pool_config({}) == {'default_concurrency': 2, 'max_concurrency': {}}
+    config = pool_config({'FIN_CLIP_OLLAMA_CONCURRENCY': '4',
+                          'FIN_CLIP_OLLAMA_MODEL_CONCURRENCY': 'qwen2.5:14b=1, qwen2.5:latest=3'})
+    assert config == {'default_concurrency': 4, 'max_concurrency': {'qwen2.5:14b': 1, 'qwen2.5:latest': 3}}
+    with pytest.raises(ValueError):
+        pool_config({'FIN_CLIP_OLLAMA_MODEL_CONCURRENCY': 'qwen2.5:14b'})
+
+
+def test_ordered_fan_out_merges_in_document_order():
+    async def generate(item):
+        delay, text = item
+        await asyncio.sleep(delay)
+        yield text[:1]
+        await asyncio.sleep(delay)
+        yield text
+
+    async def collect():
+        return [out async for out in ordered_fan_out([(0.05, 'first'), (0.01, 'second')], generate, concurrency=2)]
+
+    outputs = asyncio.run(collect())
+    assert outputs[0] == 's\n'
+    assert outputs[-1] == 'first\nsecond\n'
+
+
+def test_ollama_generate_against_fake_server():
+    server = FakeLLMServer(latency_ms=0, tokens_per_sec=0)
+    pool = OllamaPool(host=server.start())
+
+    async def collect():
+        deltas = [d async for d in ollama_generate('sys', 'a b', 'fake', '{}', options={'num_predict': 3}, pool=pool)]
+        await pool.aclose()
+        return deltas
+
+    try:
+        assert ''.join(asyncio.run(collect())) == 'a b a '
+    finally:
+        server.shutdown()
+
+
+def test_response_cache_lru(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), max_entries=2)
+    keys = [ResponseCache.key('qwen2.5:latest', 'sys', '{}', text, 20000, 0, 1024) for text in ('a', 'b', 'c')]
+    assert len(set(keys)) == 3
+    assert cache.cacheable(0) and not cache.cacheable(0.5)
+    cache.put(keys[0], 'out a')
+    cache.put(keys[1], 'out b')
+    assert cache.get(keys[0]) == 'out a'
+    cache.put(keys[2], 'out c')
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == 'out a' and len(cache) == 2
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('营收同比增长') == 6
+    assert estimate_tokens('revenue grew 20%') == 2 + 1 + 1 + 1
+
+
+def test_chunk_lines_respects_budget_and_overlap():
+    texts = ['一二三四'] * 10
+    chunks = chunk_lines(texts, max_tokens=20, overlap_tokens=5)
+    assert all(chunk.tokens <= 20 for chunk in chunks)
+    assert [(c.start_line, c.end_line) for c in chunks][:2] == [(0, 4), (3, 7)]
+    assert chunks[-1].end_line == 10
+    assert chunk_lines(['很长的一行' * 10], max_tokens=5)[0].end_line == 1
+
+
+def test_chunk_lines_clamps_overlap():
+    texts = ['一二三四'] * 40
+    # 重叠超过 max_tokens // 4 时按 max_tokens // 4 算，不会每块只前进一行
+    assert chunk_lines(texts, max_tokens=20, overlap_tokens=1000) == chunk_lines(texts, max_tokens=20, overlap_tokens=5)
+    assert len(chunk_lines(texts, max_tokens=20, overlap_tokens=1000)) == 13
+
+
+def test_throttle_batches_deltas():
+    async def deltas():
+        for i in range(10):
+            yield str(i)
+
+    async def collect(**kwargs):
+        return [out async for out in throttle(deltas(), **kwargs)]
+
+    assert asyncio.run(collect(interval=60, max_parts=4)) == ['0123', '4567', '89']
+    assert ''.join(asyncio.run(collect(interval=0))) == '0123456789'
+
+
+def test_get_backend(monkeypatch):
+    monkeypatch.setenv('FIN_CLIP_LLM_BACKEND', 'fake')
+    monkeypatch.setenv('FIN_CLIP_FAKE_LATENCY_MS', '0')
+    monkeypatch.setenv('FIN_CLIP_FAKE_TOKENS_PER_SEC', '0')
+    backend = get_backend()
+    assert isinstance(backend, FakeBackend)
+
+    async def collect():
+        messages = build_messages('sys', 'a b', '{}')
+        return [d async for d in backend.stream_chat('fake', messages, {'num_predict': 3})]
+
+    assert ''.join(asyncio.run(collect())) == 'a b a '
+    assert isinstance(get_backend('local'), OllamaBackend)
+    with pytest.raises(ValueError):
+        get_backend('unknown')
+
+
+def test_dashscope_model_selection(monkeypatch):
+    monkeypatch.delenv('FIN_CLIP_DASHSCOPE_MODEL', raising=False)
+    online = get_backend('online')
+    assert online.resolve_model('qwen-max') == 'qwen-max'
+    # 界面里的 Ollama 模型名换成默认的 DashScope 模型
+    assert online.resolve_model('qwen2.5:latest') == DashScopeBackend.DEFAULT_MODEL
+    monkeypatch.setenv('FIN_CLIP_DASHSCOPE_MODEL', 'qwen-plus')
+    assert get_backend('online').resolve_model('qwen-max') == 'qwen-plus'
+
+
+def test_metrics_record_backend_stats(tmp_path):
+    server = FakeLLMServer(latency_ms=0, tokens_per_sec=0)
+    backend = OllamaBackend(OllamaPool(host=server.start()))
+    recorder = MetricsRecorder(str(tmp_path / 'calls.jsonl'))
+
+    async def collect():
+        call = ModelCall(backend.name, 'fake', 10)
+        messages = build_messages('sys', 'a b', '{}')
+        async for _ in backend.stream_chat('fake', messages, {'num_predict': 3}, stats=call.stats):
+            call.on_delta()
+        await backend.pool.aclose()
+        return call
+
+    try:
+        call = asyncio.run(collect())
+    finally:
+        server.shutdown()
+    record = recorder.record(call)
+    assert record['output_tokens'] == 3 and record['queue_wait_s'] >= 0
+    assert record['ttft_s'] <= record['total_s']
+    recorder.record(ModelCall('local', 'fake', 10), cache_hit=True)
+
+    summary, = recorder.summary()
+    assert summary['calls'] == 2 and summary['cache_hit_rate'] == 0.5
+    assert len((tmp_path / 'calls.jsonl').read_text().splitlines()) == 2
+    assert 'fin_clip_llm_calls{backend="local",model="fake"} 2' in recorder.prometheus_text()
+
+
+def test_run_model_records_errors_and_cancellations(monkeypatch):
+    from app.utils import functions
+
+    class FailingBackend(FakeBackend):
+        name = 'failing'
+
+        async def stream_chat(self, model, messages, options=None, keep_alive=-1, stats=None):
+            yield 'a'
+            raise ConnectionError('backend down')
+
+    recorder = MetricsRecorder(None)
+    monkeypatch.setattr(functions, 'llm_metrics', recorder)
+    monkeypatch.setattr(functions, 'get_backend', lambda name=None, key=None: FailingBackend())
+
+    async def collect():
+        return [out async for out in functions.run_model('sys', 'a b', 'fake', '{}', use_cache=False, stream_interval=0)]
+
+    async def cancel():
+        outputs = functions.run_model('sys', 'a b', 'fake', '{}', use_cache=False, stream_interval=0)
+        await outputs.__anext__()
+        await outputs.aclose()
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(collect())
+    asyncio.run(cancel())
+    assert [r['error'] for r in recorder.records()] == ["ConnectionError('backend down')", 'cancelled']
+
+
+def test_run_model_counts_tokens_before_throttling(monkeypatch):
+    from app.utils import functions
+
+    class SilentBackend(FakeBackend):
+        """不报告 eval_count 的后端"""
+
+        async def stream_chat(self, model, messages, options=None, keep_alive=-1, stats=None):
+            async for token in FakeBackend.stream_chat(self, model, messages, options, keep_alive):
+                yield token
+
+    recorder = MetricsRecorder(None)
+    monkeypatch.setattr(functions, 'llm_metrics', recorder)
+
+    async def collect():
+        return [out async for out in functions.run_model('sys', 'a b', 'fake', '{}', num_predict=5, use_cache=False,
+                                                         stream_interval=60)]
+
+    for backend in (FakeBackend(0, 0), SilentBackend(0, 0)):
+        monkeypatch.setattr(functions, 'get_backend', lambda name=None, key=None: backend)
+        assert asyncio.run(collect())[-1] == 'a b a b a '
+    assert [r['output_tokens'] for r in recorder.records()] == [5, 5]
+
+
+def test_parse_chunk_size_falls_back_to_model_default():
+    assert parse_chunk_size(' 2000 ') == 2000
+    assert [parse_chunk_size(text) for text in ('', None, 'abc', '1.5k', '0', '-3')] == [None] * 6
+    assert token_budget('qwen2.5:latest', parse_chunk_size('abc')) == 3000
+
+
+def test_dashscope_error_is_raised_and_not_cached(tmp_path, monkeypatch):
+    import sys
+    import types
+    from http import HTTPStatus
+
+    from app.utils import functions
+
+    calls = []
+
+    def call(model, **kwargs):
+        calls.append(model)
+        return iter([types.SimpleNamespace(status_code=HTTPStatus.TOO_MANY_REQUESTS, request_id='r1',
+                                           code='Throttling', message='rate limited')])
+
+    monkeypatch.setitem(sys.modules, 'dashscope', types.SimpleNamespace(Generation=types.SimpleNamespace(call=call)))
+    recorder = MetricsRecorder(None)
+    monkeypatch.setattr(functions, 'llm_metrics', recorder)
+    monkeypatch.setattr(functions, 'response_cache', ResponseCache(str(tmp_path / 'cache.sqlite')))
+
+    async def collect():
+        return [out async for out in functions.run_model('sys', 'a b', 'qwen-max', '{}', temperature=0,
+                                                         local_or_online='online', stream_interval=0)]
+
+    for _ in range(2):
+        with pytest.raises(BackendError):
+            asyncio.run(collect())
+    assert len(calls) == 2
+    assert all('Throttling' in r['error'] for r in recorder.records())
@@ -0,0 +1,39 @@
+import random
+
+from rapidfuzz import fuzz
+from app.utils.matcher import SubtitleMatcher, get_matcher
+
+
+def brute_force_find(texts, seg, fuzz_param, cursor):
+    for i in range(cursor, cursor + len(texts)):
+        current_index = i % len(texts)
+        if fuzz.ratio(seg, texts[current_index]) > fuzz_param:
+            return current_index
+    return None
+
+
+def test_find_matches_brute_force():
+    rnd = random.Random(0)
+    alphabet = '营收增长利润毛率季度同比我们市场客户产品'
+    texts = [''.join(rnd.choices(alphabet, k=rnd.randint(0, 12))) for _ in range(300)]
+    matcher = SubtitleMatcher(texts)
+    for _ in range(200):
+        seg = ''.join(rnd.choices(alphabet, k=rnd.randint(0, 10)))
+        cursor = rnd.randint(0, len(texts))
+        for fuzz_param in (-1, 30, 60, 90):
+            assert matcher.find(seg, fuzz_param, cursor) == brute_force_find(texts, seg, fuzz_param, cursor)
+
+
+def test_get_matcher_is_cached(make_srt):
+    srt_text = make_srt(['第一行', '第二行'])
+    assert get_matcher(srt_text) is get_matcher(srt_text)
+
+
+def test_align_is_ordered_and_above_threshold():
+    texts = ['营收同比增长百分之二十', '毛利率保持稳定', '我们继续投入研发', '汽车交付量创新高', '电池成本下降']
+    matcher = SubtitleMatcher(texts)
+    segs = ['毛利率保持稳定', '营收同比增长百分之二十', '我们继续投入研发', '与字幕无关的概括', '电池成本下降']
+    # 前两个片段顺序颠倒，只能保留其中一个
+    out = matcher.align(segs, 80)
+    assert len(out) == 3 and out[1:] == [2, 4]
+    assert matcher.align([], 80) == []
@@ -0,0 +1,63 @@
+import os
+import sys
+import time
+import types
+
+from app.utils import render
+from app.utils.render import RenderQueue
+
+
+def fake_render(steps, job_id, events, cancel_event):
+    for i in range(steps):
+        if cancel_event.is_set():
+            raise RuntimeError('cancelled')
+        events.put((job_id, (i + 1) / steps))
+        time.sleep(0.05)
+    return f'{job_id}.mp4'
+
+
+def test_render_queue_progress_and_cancel():
+    render_queue = RenderQueue(max_workers=1)
+    try:
+        job_id = render_queue.submit(fake_render, 3)
+        updates = list(render_queue.stream(job_id, interval=0.05))
+        assert updates[-1] == ('done', 1.0)
+        assert render_queue.result(job_id) == f'{job_id}.mp4'
+
+        slow_job = render_queue.submit(fake_render, 1000)
+        queued_job = render_queue.submit(fake_render, 1)
+        assert render_queue.cancel(queued_job)
+        assert render_queue.get(queued_job).status == 'cancelled'
+        while render_queue.get(slow_job).status != 'running':
+            time.sleep(0.05)
+        assert render_queue.cancel(slow_job)
+        assert list(render_queue.stream(slow_job, interval=0.05))[-1][0] == 'cancelled'
+    finally:
+        render_queue.shutdown()
+
+
+def test_open_movie_lru_closes_evicted_and_replaced_clips(tmp_path, monkeypatch):
+    class FakeClip:
+        def __init__(self, path):
+            self.path = path
+            self.closed = False
+
+        def close(self):
+            self.closed = True
+
+    monkeypatch.setitem(sys.modules, 'moviepy', types.SimpleNamespace(VideoFileClip=FakeClip))
+    monkeypatch.setattr(render, '_movies', render.OrderedDict())
+    monkeypatch.setattr(render, 'MAX_OPEN_MOVIES', 2)
+    a, b, c = (tmp_path / name for name in ('a.mp4', 'b.mp4', 'c.mp4'))
+    for video in (a, b, c):
+        video.write_bytes(b'v')
+
+    clip_a = render._open_movie(str(a))
+    assert render._open_movie(str(a)) is clip_a
+    clip_b = render._open_movie(str(b))
+    render._open_movie(str(c))
+    assert clip_a.closed and not clip_b.closed
+    # 源视频被替换后重新打开
+    os.utime(b, ns=(1, 1))
+    assert render._open_movie(str(b)) is not clip_b and clip_b.closed
+    assert len(render._movies) == 2
@@ -0,0 +1,38 @@
+import os
+
+from app.utils.render_cache import RenderCache
+
+
+def test_key_depends_on_video_intervals_and_settings(tmp_path):
+    video = tmp_path / 'a.mp4'
+    video.write_bytes(b'video')
+    cache = RenderCache(str(tmp_path / 'stream'))
+    key = cache.key(str(video), [(0, 1000)], {'kind': 'mp4'})
+    assert key == cache.key(str(video), [(0, 1000)], {'kind': 'mp4'})
+    assert key != cache.key(str(video), [(0, 2000)], {'kind': 'mp4'})
+    assert key != cache.key(str(video), [(0, 1000)], {'kind': 'hls'})
+
+
+def test_lookup_and_evict(tmp_path):
+    cache = RenderCache(str(tmp_path), max_bytes=150)
+    (tmp_path / 'output_old.m3u8').write_text('#EXTM3U\n#EXT-X-ENDLIST\n')
+    (tmp_path / 'output_old_00000.ts').write_bytes(b'x' * 100)
+    (tmp_path / 'output_new.part.mp4').write_bytes(b'x' * 100)
+    (tmp_path / 'output_half.m3u8').write_text('#EXTM3U\n')
+    os.utime(tmp_path / 'output_old.m3u8', (1, 1))
+    os.utime(tmp_path / 'output_old_00000.ts', (1, 1))
+
+    assert cache.lookup('half', '.m3u8') is None
+    assert cache.evict() == 1
+    assert sorted(os.listdir(tmp_path)) == ['output_half.m3u8', 'output_new.part.mp4']
+
+
+def test_evict_removes_stale_part_files(tmp_path):
+    cache = RenderCache(str(tmp_path), max_bytes=10 ** 6, part_max_age=3600)
+    for name in ('output_dead.part.mp4', 'output_dead.part.mp3', 'output_live.part.mp4'):
+        (tmp_path / name).write_bytes(b'x')
+    os.utime(tmp_path / 'output_dead.part.mp4', (1, 1))
+    os.utime(tmp_path / 'output_dead.part.mp3', (1, 1))
+
+    assert cache.evict() == 0
+    assert os.listdir(tmp_path) == ['output_live.part.mp4']
@@ -0,0 +1,27 @@
+import pytest
+
+from app.utils.serving import event_limits, queue_kwargs, serving_config, worker_env
+
+
+def test_serving_config_defaults_and_env():
+    config = serving_config({})
+    assert config.port == 17777 and config.workers == 1 and config.shared_dir is None
+    config = serving_config({'FIN_CLIP_LLM_CONCURRENCY': '2', 'FIN_CLIP_MAX_QUEUE_SIZE': '0',
+                             'FIN_CLIP_SHARED_DIR': '/tmp/shared'})
+    assert config.llm_concurrency == 2 and config.max_queue_size is None
+    assert queue_kwargs(config) == {'default_concurrency_limit': config.text_concurrency, 'max_size': None}
+
+
+def test_event_limits_group_by_kind():
+    config = serving_config({'FIN_CLIP_RENDER_CONCURRENCY': '1'})
+    assert event_limits(config, 'render') == {'concurrency_id': 'render', 'concurrency_limit': 1}
+    assert event_limits(config, 'llm')['concurrency_id'] == 'llm'
+    with pytest.raises(ValueError):
+        event_limits(config, 'video')
+
+
+def test_worker_env_assigns_ports_and_shared_srt_dir():
+    config = serving_config({'FIN_CLIP_PORT': '8000', 'FIN_CLIP_SHARED_DIR': '/tmp/shared'})
+    envs = [worker_env(config, i, {}) for i in range(3)]
+    assert [env['FIN_CLIP_PORT'] for env in envs] == ['8000', '8001', '8002']
+    assert envs[0]['FIN_CLIP_SHARED_SRT_DIR'] == '/tmp/shared/srt'
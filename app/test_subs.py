@@ -0,0 +1,67 @@
+import pytest
+from app.utils.subs import SrtCache, SubtitleTable, is_srt_handle
+
+
+def test_put_text_parses_once(make_srt):
+    cache = SrtCache()
+    srt_text = make_srt(['第一行', '第二行'])
+    handle = cache.put_text(srt_text)
+    assert is_srt_handle(handle)
+    assert cache.put_text(srt_text) == handle
+    parsed = cache.get(handle)
+    assert parsed is cache.get(handle)
+    assert list(parsed.starts) == [0, 1000]
+    assert list(parsed.ends) == [900, 1900]
+    assert parsed.full_text == '第一行\n第二行\n'
+    assert parsed.to_srt([1]) == '1\n00:00:01,000 --> 00:00:01,900\n第二行\n\n'
+
+
+def test_lru_eviction_and_reload(tmp_path, make_srt):
+    cache = SrtCache(max_entries=2)
+    srt_file = tmp_path / 'a.srt'
+    srt_file.write_text(make_srt(['a']), encoding='utf-8')
+    first = cache.load(str(srt_file))
+    cache.put_text(make_srt(['b']))
+    cache.put_text(make_srt(['c']))
+    assert len(cache) == 2 and first not in cache
+    # 从文件加载的字幕被淘汰后可以按来源路径重新解析
+    assert cache.get(first).text(0) == 'a'
+
+
+def test_shared_dir_resolves_handles_across_caches(tmp_path, make_srt):
+    # 两个 app 进程各有自己的缓存，共用一个目录
+    worker_a = SrtCache(shared_dir=str(tmp_path / 'srt'))
+    worker_b = SrtCache(shared_dir=str(tmp_path / 'srt'))
+    srt_file = tmp_path / 'a.srt'
+    srt_file.write_text(make_srt(['共享']), encoding='utf-8')
+    handle = worker_a.load(str(srt_file))
+    srt_file.unlink()
+    assert handle not in worker_b
+    assert worker_b.get(handle).text(0) == '共享'
+    with pytest.raises(KeyError):
+        SrtCache().get(handle)
+    # 直接解析的文本（比如 invert_find 的中间结果）不写进共用目录
+    worker_a.put_text(make_srt(['中间结果']))
+    assert len(list((tmp_path / 'srt').iterdir())) == 1
+
+
+def test_subtitle_table_lookups():
+    table = SubtitleTable([0, 1000, 5000], [900, 1900, 6000], ['营收', '', '利润率'])
+    assert table.full_text == '营收\n\n利润率\n'
+    assert [table.text(i) for i in range(3)] == ['营收', '', '利润率']
+    assert list(table.iter_texts()) == ['营收', '', '利润率']
+    assert table.index_at(1500) == 1
+    assert table.index_at(3000) is None
+    assert table.index_at(-1) is None
+    assert table.line_at_offset(table.full_text.index('利')) == 2
+
+
+def test_concurrent_put_text_counts_chars_once(make_srt):
+    from concurrent.futures import ThreadPoolExecutor
+
+    cache = SrtCache()
+    srt_text = make_srt(['并发'] * 200)
+    with ThreadPoolExecutor(8) as pool:
+        handles = set(pool.map(lambda _: cache.put_text(srt_text), range(32)))
+    assert len(handles) == 1 and len(cache) == 1
+    assert cache._chars == cache.get(handles.pop()).char_count()
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from app.utils.dbs import PromptStore, insert_prompt
+from app.utils.templates import TemplateRegistry, read_template_file
+
+
+def test_registry_loads_all_sources(tmp_path):
+    tpl_file = tmp_path / 'templates.json'
+    tpl_file.write_text(json.dumps([{'key': 'srt_chunk_prompt', 'desc': 'summary', 'prompt': 'summarize'}]))
+    empty_file = tmp_path / 'empty.json'
+    empty_file.write_text('')
+    db_path = str(tmp_path / 'prompts.sqlite')
+    insert_prompt('extract pairs', 'pairs', 'srt_chunk_prompt', db_path)
+
+    registry = TemplateRegistry(template_files=(str(tpl_file), str(empty_file)), prompt_dbs=(db_path,))
+    assert registry.get('d_templates/爱国类').prompt == ''
+    assert [t.desc for t in registry.by_key('srt_chunk_prompt')] == ['summary', 'pairs']
+    with pytest.raises(KeyError):
+        registry.get('srt_chunk_prompt/missing')
+    assert read_template_file(str(empty_file)) == []
+
+
+def test_registry_versions_and_round_trip(tmp_path):
+    registry = TemplateRegistry(template_files=(), prompt_dbs=())
+    v1 = registry.add('k', 'd', 'first')
+    assert registry.add('k', 'd', 'first') == v1
+    v2 = registry.add('k', 'd', 'second')
+    assert v1.version != v2.version
+    assert registry.get('k/d') == v2
+    assert registry.get(f'k/d@{v1.version}').prompt == 'first'
+
+    out = tmp_path / 'export.json'
+    registry.export_file(str(out), all_versions=True)
+    other = TemplateRegistry(template_files=(), prompt_dbs=())
+    other.import_file(str(out))
+    assert other.get(f'k/d@{v1.version}').prompt == 'first'
+    assert other.get('k/d').prompt == 'second'
+
+
+def test_registry_sees_prompts_from_other_processes(tmp_path):
+    db_path = str(tmp_path / 'prompts.sqlite')
+    insert_prompt('first', 'a', 'srt_chunk_prompt', db_path)
+    registry = TemplateRegistry(template_files=(), prompt_dbs=(db_path,))
+    assert registry.get('srt_chunk_prompt/a').prompt == 'first'
+    # 另一个 app 进程写入同一个提示词库
+    other = PromptStore(db_path)
+    other.insert('srt_chunk_prompt', 'b', 'second')
+    other.close()
+    assert registry.get('srt_chunk_prompt/b').prompt == 'second'
+    assert [t.desc for t in registry.by_key('srt_chunk_prompt')] == ['a', 'b']
@@ -0,0 +1,65 @@
+import os
+
+import ffmpeg
+
+from app.utils.video import CutPlan, merge_intervals, normalize_timeline, ms_to_timestamp, on_keyframe, build_preview_output, \
+    get_keyframes, plan_cuts
+
+
+def test_merge_intervals():
+    starts = [5000, 0, 900, 20000, 7000]
+    ends = [6000, 1000, 1500, 21000, 7000]
+    assert merge_intervals(starts, ends) == [(0, 1500), (5000, 6000), (20000, 21000)]
+
+
+def test_merge_intervals_with_gap_and_padding():
+    starts = [1000, 2200, 9000]
+    ends = [2000, 3000, 9500]
+    assert merge_intervals(starts, ends, max_gap_ms=300) == [(1000, 3000), (9000, 9500)]
+    assert merge_intervals(starts, ends, pad_ms=100) == [(900, 3100), (8900, 9600)]
+    assert normalize_timeline(starts, ends, max_gap_ms=10000) == [(1000, 9500)]
+
+
+def test_ms_to_timestamp():
+    assert ms_to_timestamp(3723004) == '01:02:03.004'
+
+
+def test_on_keyframe():
+    keyframes = (0, 2000, 4000)
+    assert on_keyframe(2030, keyframes, 40)
+    assert not on_keyframe(2100, keyframes, 40)
+    assert not on_keyframe(5000, keyframes, 40)
+
+
+def test_build_preview_output_reencodes_from_concat_list(tmp_path):
+    plan = CutPlan([(10000, 11500), (20000, 21000)], False)
+    args = build_preview_output(plan, 'in.mp4', str(tmp_path / 'out.m3u8'), hw_device='none').get_args()
+    assert args[:args.index('-i') + 2] == ['-f', 'concat', '-safe', '0', '-segment_time_metadata', '1',
+                                           '-i', str(tmp_path / 'out.txt')]
+    assert args[args.index('-vf') + 1] == 'select=concatdec_select,scale=640:478'
+    assert args[args.index('-af') + 1] == 'aselect=concatdec_select'
+    assert (tmp_path / 'out.txt').read_text().count('inpoint') == 2
+
+
+def test_get_keyframes_reads_packet_flags_in_windows(tmp_path, monkeypatch):
+    video = tmp_path / 'in.mp4'
+    video.write_bytes(b'v1')
+    calls = []
+
+    def fake_probe(path, **kwargs):
+        calls.append(kwargs)
+        return {'packets': [{'pts_time': '2.000000', 'flags': 'K__'}, {'pts_time': '2.040000', 'flags': '___'},
+                            {'pts_time': '0.000000', 'flags': 'K_'}]}
+
+    monkeypatch.setattr(ffmpeg, 'probe', fake_probe)
+    plan = plan_cuts(str(video), [(0, 1000), (2010, 3000)])
+    assert plan.stream_copy
+    assert calls[0]['show_entries'] == 'packet=pts_time,flags'
+    assert calls[0]['read_intervals'] == '0.000%0.040,1.970%2.050'
+    assert get_keyframes(str(video), [(-40, 40), (1970, 2050)]) == (0, 2000)
+    assert len(calls) == 1
+    # 文件被替换后重新探测
+    video.write_bytes(b'v2 longer')
+    os.utime(video, ns=(1, 1))
+    get_keyframes(str(video), [(-40, 40), (1970, 2050)])
+    assert len(calls) == 2
@@ -0,0 +1,146 @@
+import asyncio
+import os
+from http import HTTPStatus
+
+from .llm import ollama_pool
+
+
+def fake_tokens(messages, num_predict):
+    """确定性的假输出：把最后一条消息按空白切分后循环输出 num_predict 个 token"""
+    words = (messages[-1]['content'] if messages else '').split() or ['token']
+    if not num_predict or num_predict < 0:
+        num_predict = 128
+    for i in range(num_predict):
+        yield words[i % len(words)] + ' '
+
+
+class BackendError(RuntimeError):
+    """后端返回了错误响应（例如限流），run_model 会记录错误，不写入缓存"""
+
+
+class LLMBackend:
+    """
+    模型后端接口。stream_chat 是逐个产出增量文本的异步生成器。
+
+    options 使用 Ollama 的参数名（num_ctx、temperature、num_predict），由各后端自行转换。
+    stats 是可选的 dict，后端可以写入 queue_wait_s、eval_count、prompt_eval_count 供 metrics 记录。
+    """
+
+    name = ''
+
+    def resolve_model(self, model):
+        """实际请求的模型名，用于缓存键和 metrics"""
+        return model
+
+    async def stream_chat(self, model, messages, options=None, keep_alive=-1, stats=None):
+        raise NotImplementedError
+        yield
+
+
+class OllamaBackend(LLMBackend):
+    name = 'local'
+
+    def __init__(self, pool=None):
+        self.pool = pool or ollama_pool
+
+    async def stream_chat(self, model, messages, options=None, keep_alive=-1, stats=None):
+        async for chunk in self.pool.chat(model=model, messages=messages, options=options, keep_alive=keep_alive, stats=stats):
+            if chunk.get('done') and stats is not None:
+                stats['eval_count'] = chunk.get('eval_count')
+                stats['prompt_eval_count'] = chunk.get('prompt_eval_count')
+            yield chunk['message']['content']
+
+
+class DashScopeBackend(LLMBackend):
+    """
+    阿里云 DashScope。同步的流式接口放在线程里迭代，不阻塞事件循环。
+
+    :param model: 固定使用的模型（get_backend 传入环境变量 FIN_CLIP_DASHSCOPE_MODEL），为空时使用调用时的模型名；
+                  界面里选的是 Ollama 的 "name:tag"，不是 DashScope 的模型名，这时使用 DEFAULT_MODEL
+    """
+
+    name = 'online'
+    DEFAULT_MODEL = 'qwen2-72b-instruct'
+
+    def __init__(self, model=None, api_key=None):
+        self.model = model
+        self.api_key = api_key
+
+    def resolve_model(self, model):
+        if self.model:
+            return self.model
+        if model and ':' not in model:
+            return model
+        return self.DEFAULT_MODEL
+
+    async def stream_chat(self, model, messages, options=None, keep_alive=-1, stats=None):
+        import dashscope
+
+        options = options or {}
+        print('call online model')
+        responses = await asyncio.to_thread(
+            dashscope.Generation.call,
+            self.resolve_model(model),
+            api_key=self.api_key,
+            messages=messages,
+            seed=1,  # set the random seed, optional, default to 1234 if not set
+            result_format='message',  # set the result to be "message"  format.
+            stream=True,
+            incremental_output=True,  # get streaming output incrementally
+            temperature=options.get('temperature', 0.1),
+            max_tokens=options.get('num_predict', 3000),
+        )
+        responses = iter(responses)
+        while True:
+            response = await asyncio.to_thread(next, responses, None)
+            if response is None:
+                break
+            if response.status_code == HTTPStatus.OK:
+                if stats is not None and response.usage:
+                    stats['eval_count'] = response.usage.get('output_tokens')
+                    stats['prompt_eval_count'] = response.usage.get('input_tokens')
+                yield response.output.choices[0]['message']['content']
+            else:
+                raise BackendError('Request id: %s, Status code: %s, error code: %s, error message: %s' % (
+                    response.request_id, response.status_code,
+                    response.code, response.message
+                ))
+
+
+class FakeBackend(LLMBackend):
+    """进程内的确定性假模型，可以配置首 token 延迟和每秒 token 数"""
+
+    name = 'fake'
+
+    def __init__(self, latency_ms=200, tokens_per_sec=50):
+        self.latency_ms = latency_ms
+        self.tokens_per_sec = tokens_per_sec
+
+    async def stream_chat(self, model, messages, options=None, keep_alive=-1, stats=None):
+        await asyncio.sleep(self.latency_ms / 1000)
+        interval = 1 / self.tokens_per_sec if self.tokens_per_sec > 0 else 0
+        count = 0
+        for token in fake_tokens(messages, (options or {}).get('num_predict')):
+            count += 1
+            yield token
+            await asyncio.sleep(interval)
+        if stats is not None:
+            stats['eval_count'] = count
+
+
+def get_backend(name=None, key=None):
+    """
+    按名字取得后端，name 为空时读取环境变量 FIN_CLIP_LLM_BACKEND（默认 local）。
+
+    local 使用 Ollama（地址由 OLLAMA_HOST 决定，可以指向 app/fake_llm_server.py），
+    online 使用 DashScope（模型由 FIN_CLIP_DASHSCOPE_MODEL 指定），fake 使用进程内的假模型（FIN_CLIP_FAKE_LATENCY_MS、FIN_CLIP_FAKE_TOKENS_PER_SEC）。
+    """
+    name = name or os.getenv('FIN_CLIP_LLM_BACKEND', 'local')
+    if name == 'local':
+        return OllamaBackend()
+    if name == 'online':
+        return DashScopeBackend(model=os.getenv('FIN_CLIP_DASHSCOPE_MODEL') or None, api_key=key)
+    if name == 'fake':
+        return FakeBackend(float(os.getenv('FIN_CLIP_FAKE_LATENCY_MS', 200)),
+                           float(os.getenv('FIN_CLIP_FAKE_TOKENS_PER_SEC', 50)))
+    raise ValueError(f'Invalid LLM backend: {name}')
@@ -0,0 +1,145 @@
+import hashlib
+import math
+import re
+from collections import OrderedDict, namedtuple
+
+# 一个文档块：page_content 与 langchain 的 Document 兼容，另外记录对应的字幕行范围 [start_line, end_line)
+Chunk = namedtuple('Chunk', ['page_content', 'start_line', 'end_line', 'tokens'])
+
+# 每个模型单次调用输入文本的 token 预算，越小推理越快
+MODEL_TOKEN_BUDGETS = {
+    'qwen2.5:latest': 3000,
+    'qwen2.5:14b': 3000,
+}
+DEFAULT_TOKEN_BUDGET = 3000
+
+_CJK = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]')
+_WORD = re.compile(r'[A-Za-z0-9]+|[^\sA-Za-z0-9]')
+
+
+def estimate_tokens(text):
+    """
+    快速估计 token 数，不加载分词器。
+
+    中日韩文字按每个字 1 个 token，英文和数字按每 4 个字符 1 个 token，其他符号每个 1 个 token，
+    对 Qwen 系列的分词结果略有高估，保证不会超出上下文。
+    """
+    cjk = len(_CJK.findall(text))
+    tokens = 0
+    for word in _WORD.findall(_CJK.sub('', text)):
+        tokens += math.ceil(len(word) / 4) if word[0].isalnum() else 1
+    return cjk + tokens
+
+
+def parse_chunk_size(text):
+    """界面里输入的块大小：正整数时返回 int，空白或者不是正整数时返回 None（使用模型默认的预算）"""
+    try:
+        value = int(str(text).strip())
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def token_budget(model_select, override=None):
+    if override:
+        return int(override)
+    return MODEL_TOKEN_BUDGETS.get(model_select, DEFAULT_TOKEN_BUDGET)
+
+
+def context_size(budget, prompt_text, num_predict, step=2048):
+    """
+    估算需要的 num_ctx，按 step 向上取整。
+
+    同一个模型的 num_ctx 变化时 Ollama 会重新加载模型，所以同一批块要用同一个值。
+    """
+    needed = budget + estimate_tokens(prompt_text) + max(num_predict, 0) + 256
+    return int(math.ceil(needed / step) * step)
+
+
+def chunk_lines(texts, max_tokens, overlap_tokens=0, split_scores=None):
+    """
+    按字幕行边界把文本切成不超过 max_tokens 的块，相邻块重叠约 overlap_tokens 个 token。
+
+    重叠最多 max_tokens // 4，否则每块只前进一两行，块数和模型调用次数会成倍增加。
+
+    :param texts: 字幕行文本列表
+    :param split_scores: 可选，split_scores[i] 越大越适合在第 i 行之前切分（语义切分时使用），
+                         会在块的后半部分里选得分最高的位置切分
+    """
+    overlap_tokens = min(overlap_tokens, max_tokens // 4)
+    counts = [estimate_tokens(text) + 1 for text in texts]
+    chunks = []
+    start = 0
+    n = len(texts)
+    while start < n:
+        end = start
+        total = 0
+        while end < n and (end == start or total + counts[end] <= max_tokens):
+            total += counts[end]
+            end += 1
+        if split_scores is not None and end < n and end - start > 2:
+            half = start + (end - start) // 2
+            best = max(range(half, end), key=lambda i: split_scores[i])
+            if best > start:
+                end = best
+                total = sum(counts[start:end])
+        chunks.append(Chunk(''.join(text + '\n' for text in texts[start:end]), start, end, total))
+        if end >= n:
+            break
+        # 从块尾往回数出重叠的行，保证下一块至少前进一行
+        next_start = end
+        overlap = 0
+        while next_start - 1 > start and overlap + counts[next_start - 1] <= overlap_tokens:
+            next_start -= 1
+            overlap += counts[next_start]
+        start = next_start
+    return chunks
+
+
+class EmbeddingCache:
+    """按 (模型, 文本哈希) 缓存字幕行向量，避免每次语义切分都重新计算"""
+
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def embed(self, texts, model='nomic-embed-text'):
+        keys = [(model, hashlib.sha1(text.encode('utf-8')).hexdigest()) for text in texts]
+        missing = list({key: text for key, text in zip(keys, texts) if key not in self._entries}.items())
+        if missing:
+            from langchain_ollama import OllamaEmbeddings
+            vectors = OllamaEmbeddings(model=model).embed_documents([text for _, text in missing])
+            for (key, _), vector in zip(missing, vectors):
+                self._entries[key] = vector
+        for key in keys:
+            self._entries.move_to_end(key)
+        out = [self._entries[key] for key in keys]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return out
+
+
+embedding_cache = EmbeddingCache()
+
+
+def semantic_split_scores(texts, model='nomic-embed-text'):
+    """相邻两行向量的余弦距离，距离越大说明话题变化越明显，越适合切分"""
+    vectors = embedding_cache.embed(texts, model)
+    scores = [0.0]
+    for prev, cur in zip(vectors, vectors[1:]):
+        dot = sum(a * b for a, b in zip(prev, cur))
+        norm = math.sqrt(sum(a * a for a in prev)) * math.sqrt(sum(b * b for b in cur)) or 1.0
+        scores.append(1 - dot / norm)
+    return scores
+
+
+def chunk_subtitles(subs, max_tokens, overlap_tokens=200, semantic=False, embedding_model='nomic-embed-text'):
+    """
+    把字幕表切成适合单次 LLM 调用的块。
+
+    :param subs: SubtitleTable
+    :param semantic: 为 True 时在每块后半部分按语义变化最大的位置切分
+    """
+    texts = list(subs.iter_texts())
+    split_scores = semantic_split_scores(texts, embedding_model) if semantic and texts else None
+    return chunk_lines(texts, max_tokens, overlap_tokens, split_scores)
@@ -1,18 +1,126 @@
-from tinydb import TinyDB, Query
+import json
+import os
+import sqlite3
+import threading
 
-# function: insert prompt into tinydb
+
+class PromptStore:
+    """
+    提示词模板库（SQLite WAL），按 key 建索引。
+
+    连接在进程内复用，query 的结果按 key 缓存在内存里，写入时使对应 key 的缓存失效；
+    其他进程写入后 PRAGMA data_version 会变化，这时清空整个缓存。
+    db_path 是旧的 TinyDB JSON 文件时，使用同名的 .sqlite 文件，第一次创建时把 JSON 里的记录导入。
+    """
+
+    def __init__(self, db_path):
+        self.json_path = None
+        if db_path.endswith('.json'):
+            self.json_path = db_path
+            db_path = os.path.splitext(db_path)[0] + '.sqlite'
+        self.db_path = db_path
+        self._conn = None
+        self._cache = {}
+        self._data_version = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            if os.path.dirname(self.db_path):
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # 几个进程同时第一次打开时，只有一个能建表并导入旧的 JSON
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'prompts'").fetchone()
+                conn.execute('CREATE TABLE IF NOT EXISTS prompts ('
+                             'id INTEGER PRIMARY KEY, key TEXT NOT NULL, desc TEXT, prompt TEXT NOT NULL)')
+                conn.execute('CREATE INDEX IF NOT EXISTS prompts_key ON prompts(key)')
+                if not exists and self.json_path and os.path.exists(self.json_path):
+                    conn.executemany('INSERT INTO prompts (key, desc, prompt) VALUES (?, ?, ?)',
+                                     self._read_tinydb(self.json_path))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                conn.close()
+                raise
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _read_tinydb(json_path):
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f) if os.path.getsize(json_path) else {}
+        rows = []
+        for table in data.values():
+            for _, d in sorted(table.items(), key=lambda item: int(item[0])):
+                if 'key' in d and 'prompt' in d:
+                    rows.append((d['key'], d.get('desc'), d['prompt']))
+        return rows
+
+    def insert(self, key, desc, prompt):
+        with self._lock:
+            conn = self._connect()
+            conn.execute('INSERT INTO prompts (key, desc, prompt) VALUES (?, ?, ?)', (key, desc, prompt))
+            conn.commit()
+            self._cache.pop(key, None)
+
+    def query(self, key):
+        """返回 [descs, prompts]，按插入顺序"""
+        with self._lock:
+            conn = self._connect()
+            data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version != self._data_version:
+                self._cache.clear()
+                self._data_version = data_version
+            if key not in self._cache:
+                rows = conn.execute('SELECT desc, prompt FROM prompts WHERE key = ? ORDER BY id',
+                                               (key,)).fetchall()
+                self._cache[key] = ([desc for desc, _ in rows if desc is not None], [prompt for _, prompt in rows])
+            descs, prompts = self._cache[key]
+            return [list(descs), list(prompts)]
+
+    def data_version(self):
+        """PRAGMA data_version：其他连接（其他进程）提交写入后会变化"""
+        with self._lock:
+            return self._connect().execute('PRAGMA data_version').fetchone()[0]
+
+    def rows(self):
+        """所有记录 [{'key', 'desc', 'prompt'}, ...]，按插入顺序"""
+        with self._lock:
+            rows = self._connect().execute('SELECT key, desc, prompt FROM prompts ORDER BY id').fetchall()
+        return [{'key': key, 'desc': desc, 'prompt': prompt} for key, desc, prompt in rows]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._cache.clear()
+            self._data_version = None
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_prompt_store(db_path):
+    """每个 db_path 共用一个 PromptStore"""
+    with _stores_lock:
+        if db_path not in _stores:
+            _stores[db_path] = PromptStore(db_path)
+        return _stores[db_path]
+
+
+# function: insert prompt into prompt store
 def insert_prompt(prompt, prompt_desc, key, db_path):
     if prompt == '':
         return
-    db = TinyDB(db_path)
-    db.insert({'key': key, 'desc': prompt_desc, 'prompt': prompt})
+    get_prompt_store(db_path).insert(key, prompt_desc, prompt)
+    # 新提示词马上可以按模板 id 引用
+    from .templates import template_registry
+    template_registry.add(key, prompt_desc or '', prompt, source=db_path)
 
 def query_prompt(key, db_path):
-    db = TinyDB(db_path)
-    query = Query()
-    result = db.search(query.key == key)
-    # 获得数组中每个dict的key为desc的所有值
-    descs = [d['desc'] for d in result if 'desc' in d]
-    prompts = [d['prompt'] for d in result if 'prompt' in d]
-    print(descs)
-    return [descs, prompts]
+    return get_prompt_store(db_path).query(key)
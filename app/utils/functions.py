@@ -1,28 +1,20 @@
-
-import pysubs2
-
-from ollama import Client, AsyncClient
-from rapidfuzz import fuzz
-from datetime import datetime
-import pytz
-import ffmpeg
-import re
+# moviepy、ffmpeg-python、rapidfuzz、pysubs2、pypinyin、ollama 等依赖都在第一次用到时才导入，
+# 启动 fin_clip.py 时只加载标准库和本包里的轻量模块，见 app/test_import_time.py
 import os
 import shutil
-import dashscope
 #from gradio_streamvideo import StreamVideo
-import time
-from http import HTTPStatus
-import asyncio
-from moviepy import VideoFileClip, concatenate_videoclips
-import moviepy
-from pypinyin import lazy_pinyin
-import json
+from .subs import srt_cache, parse_srt
+from .video import normalize_timeline, plan_cuts, build_preview_output, ms_to_timestamp, pick_video_encoder
+from .render_cache import render_cache
+from .llm import build_messages, ordered_fan_out, throttle
+from .backends import get_backend
+from .response_cache import response_cache
+from .chunker import chunk_subtitles, token_budget, context_size, estimate_tokens
+from .metrics import ModelCall, llm_metrics
+from .templates import template_registry, read_template_file
 def load_template_from_json_file(json_file):
-    # open jsonp file
-    with open(json_file, 'r') as f:
-        data = json.load(f)
-    
+    return read_template_file(json_file)
+
 def save_video(video, target_path):
     """
     Saves the uploaded video to the specified target path.
@@ -43,89 +35,60 @@ def load_srt_file(srt_file):
         srt_text = f.read()
     return [srt_text, len(srt_text)]
 
-from langchain_experimental.text_splitter import SemanticChunker
-from langchain_ollama import OllamaEmbeddings
-
 
-from langchain_core.documents import BaseDocumentTransformer, Document
-import itertools
-def chunk_run_model(system_prompt,docs, model_select,  user_prompt,  temperature=0.1, num_ctx=30000,keep_alive=-1, num_predict=150):
-    all = ""
-    for doc in docs:
-
-        if len(doc.page_content) <=2:
-            continue
-        #print(f"doc is <{doc.page_content}>")
-        for out in  run_model(system_prompt, doc.page_content, model_select,  user_prompt,  temperature=temperature, num_ctx=num_ctx,keep_alive=keep_alive, num_predict=num_predict):
-            yield all+f"{out.strip()}"
-        all += f"{out.strip()}" + "\n"
-        yield all
-
-def load_d_templates(d_templates):
-    t_p_dic ={
-        "科普类":'''你是一名科普类短视频博主，你的主要观众在小红书。你需要从科技类演讲的速记稿中寻找适合做科普短视频的案例和包含案例前因后果的具体文字。你需要对速记稿中的每一个案例内容进行仔细打分，得分点如下：
-1. 故事情节的完整程度，加0到10分
-3. 激发读者的画面感的生动程度，加0到10分
-4. 细节动作描写的连贯程度，加0到10分
-5. 文字中提到日常工作生活会用到的物品的流行程度，加0到10分
-6. 问题解决前后对比的差异程度，加0-10分
-7. 面向观众人群理解的通俗程度，加0-10分
-打分过程示例：
-得分点1得分5分，得分点2得分3分，得分点3得分0分。最后得分：5+3+0=8 分
-你需要一步一步的思考如何完成工作，先找出符合需求的案例进行打分，再输出得分最高的5个案例。
-输出的格式如下：
-第一步：找出案例并打分
-1. 案例：[案例的具体文字]，得分点：[得分点]，分数：[分数]，
-1. 案例：[案例的具体文字]，得分点：[得分点]，分数：[分数]，
-第二步：输出得分最高的5个案例''',
+async def chunk_run_model(system_prompt,docs, model_select,  user_prompt,  temperature=0.1, num_ctx=30000,keep_alive=-1, num_predict=150, concurrency=4, use_cache=True, template_id=None):
+    """
+    并发地对每个文档块调用模型，任意一块有新输出时按文档顺序产出拼接后的全部输出。
+    """
+    texts = [doc.page_content for doc in docs if len(doc.page_content) > 2]
 
+    def generate(text):
+        return run_model(system_prompt, text, model_select,  user_prompt,  temperature=temperature, num_ctx=num_ctx,keep_alive=keep_alive, num_predict=num_predict, use_cache=use_cache, template_id=template_id)
 
-        "教培类":'''你是一名科普类短视频博主，你的主要观众在小红书。你需要从科技类演讲的速记稿中寻找适合做科普短视频的案例和包含案例前因后果的具体文字。你需要对速记稿中的每一个案例内容进行仔细打分，注意你打分的评价标准是参加信息学竞赛的家长的接受度和喜爱程度。得分点如下：
-1. 故事情节的完整程度，加0到10分
-3. 激发读者的画面感的生动程度，加0到10分
-4. 细节动作描写的连贯程度，加0到10分
-5. 文字中提到日常工作生活会用到的物品的流行程度，加0到10分
-6. 问题解决前后对比的差异程度，加0-10分
-7. 面向观众人群理解的通俗程度，加0-10分
-8. 引发家长的焦虑程度，加0-10分
-打分过程示例：
-得分点1得分5分，得分点2得分3分，得分点3得分0分。最后得分：5+3+0=8 分
-你需要一步一步的思考如何完成工作，先找出符合需求的案例进行打分，再输出得分最高的5个案例。
-输出的格式如下：
-第一步：找出案例并打分
-1. 案例：[案例的具体文字]，得分点：[得分点]，分数：[分数]，
-1. 案例：[案例的具体文字]，得分点：[得分点]，分数：[分数]，
-第二步：输出得分最高的5个案例''',
+    async for out in ordered_fan_out(texts, generate, concurrency=concurrency):
+        yield out
 
+async def chunked_run_model(system_prompt, srt_file, model_select, user_prompt, temperature=0.1, num_predict=1024, chunk_tokens=None, overlap_tokens=200, semantic=False, keep_alive=-1, use_cache=True, template_id=None):
+    """
+    按字幕行把整份字幕切成符合模型 token 预算的块，再用 chunk_run_model 并发处理。
 
+    :param srt_file: srt_cache 的句柄或者字幕文本
+    :param chunk_tokens: 每块的 token 预算，为空时使用模型的默认预算
+    :param template_id: 模板注册表里的系统提示词 id，不为空时代替 system_prompt，所有块使用同一个版本
+    """
+    if template_id:
+        template = template_registry.get(template_id)
+        system_prompt, template_id = template.prompt, f"{template.id}@{template.version}"
+    subs = parse_srt(srt_file)
+    budget = token_budget(model_select, chunk_tokens)
+    docs = chunk_subtitles(subs, budget, overlap_tokens=overlap_tokens, semantic=semantic)
+    num_ctx = context_size(budget, system_prompt + user_prompt, num_predict)
+    print(f"{len(subs)} subtitles -> {len(docs)} chunks, budget {budget} tokens, num_ctx {num_ctx}")
+    async for out in chunk_run_model(system_prompt, docs, model_select, user_prompt, temperature=temperature, num_ctx=num_ctx, keep_alive=keep_alive, num_predict=num_predict, use_cache=use_cache, template_id=template_id):
+        yield out
 
-        "爱国类":"",
-    }
-    return  t_p_dic[d_templates]
+def load_d_templates(d_templates):
+    return template_registry.get(f'd_templates/{d_templates}').prompt
 def gen_full_text(srt_file, path = ''):
     # #print(f"srt_file:{srt_file}")
     # if os.path.isabs(srt_file):
     #     srt_file = srt_file
     # else:
     srt_file = os.path.join(path, srt_file)
-    subs = pysubs2.load(srt_file)
-    full_txt = ''
-    for line in subs:
-        full_txt += line.text + '\n'
+    handle = srt_cache.load(srt_file)
+    full_txt = parse_srt(handle).full_text
 
-    return [ len(full_txt), full_txt, subs.to_string('srt')]
+    return [ len(full_txt), full_txt, handle]
 
 def load_text_from_srt(srt_file, path = ''):
     if srt_file is None:
         return ["",""]
     #print(f"srt_file:{srt_file}")
     srt_file = os.path.join(path, srt_file)
-    subs = pysubs2.load(srt_file)
-    full_txt = ''
-    for line in subs:
-        full_txt += line.text + '\n'
+    handle = srt_cache.load(srt_file)
+    full_txt = parse_srt(handle).full_text
 
-    return [full_txt, subs.to_string('srt')]
+    return [full_txt, handle]
 def gen_key_words( target, like):
     format_str = """你是严格按照工作要求的句子剪辑器。你的输入是现场演讲的速记稿。注意你需要对速记稿从前到后分析后，才能开始剪辑。你需要发现打动人心的文字或者案例。你的工作需要分步骤完成：
 * 面向{}人群的需求，输出不超过7个片段的小标题，输出案例摘要，案例关键词，输出案例内容中的日常物品
@@ -154,95 +117,104 @@ def gen_system_prompt(target, like, style, key_words, topic):
         post = """注意如果没有找到就输出没有并终止输出。注意匹配出的句子需要保持原文。注意输出格式，\“\”是连接符号：
 - 输出“每步的输出”"""
         return prev + content + post
-def call_stream_with_messages(full_text, model_select, system_prompt, user_prompt,  temperature=0.1, num_predict=3000, key = None ):
-    print('call online model')
-    dashscope.api_key = key # 
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_prompt+full_text}]
-    responses = dashscope.Generation.call(
-        'qwen2-72b-instruct',
-        messages=messages,
-        seed=1,  # set the random seed, optional, default to 1234 if not set
-        result_format='message',  # set the result to be "message"  format.
-        stream=True,
-        output_in_full=True,  # get streaming output incrementally
-        temperature=temperature,
-        max_tokens=num_predict
-
-    )
-
-    for response in responses:
-        if response.status_code == HTTPStatus.OK:
-            print(response.output.choices[0]['message']['content'])
-            yield response.output.choices[0]['message']['content']
-        else:
-            yield ('Request id: %s, Status code: %s, error code: %s, error message: %s' % (
-                response.request_id, response.status_code,
-                response.code, response.message
-            ))
+async def run_model(system_prompt, full_text, model_select, user_prompt,  temperature=0.1, num_ctx=30000, num_predict=250, keep_alive=-1, local_or_online=None, key=None, stream=False, use_cache=True, stream_interval=0.05, template_id=None):
+    """
+    调用模型并流式产出结果。
 
-async def run_model(system_prompt, full_text, model_select, user_prompt,  temperature=0.1, num_ctx=30000, num_predict=250, keep_alive=-1, local_or_online='local', key=None, stream=False):
+    :param local_or_online: 模型后端名（local、online、fake），为空时由环境变量 FIN_CLIP_LLM_BACKEND 决定
+    :param stream: False 时产出到目前为止的完整输出，True 时只产出增量，由调用方自己拼接
+    :param stream_interval: 增量按这个间隔（秒）合并后再产出，减少界面刷新次数
+    :param template_id: 模板注册表里的系统提示词 id（"key/desc" 或 "key/desc@version"），
+                        不为空时代替 system_prompt，缓存按模板版本区分
+    """
     #print(f"full_text is {full_text}")
-    if local_or_online == 'local':
-        pre_out = ""
-        ollama = AsyncClient() #(host="100.103.46.96")
-        print(f"full_text is {full_text}, system_prompt is {system_prompt}\
-            user_prompt is {user_prompt}\
-                temperature is {temperature}\
-                    num_ctx is {num_ctx}\
-                        num_predict is {num_predict}\
-                            ")
-        try:
-            async for chunk in await ollama.chat(model=model_select, messages=[
-                {'role': 'system', 'content': system_prompt},
-                {'role': 'user', 'content': user_prompt.format(full_text)  }
-            ],options= {
-                "num_ctx": num_ctx ,
-                "temperature" : temperature,
-                'num_predict' : num_predict
-            }, keep_alive=keep_alive, stream=True):
-                if stream == False:
-                    pre_out = pre_out + chunk['message']['content']
-                else:
-                    yield chunk['message']['content']
+    cache_prompt = system_prompt
+    if template_id:
+        template = template_registry.get(template_id)
+        system_prompt = template.prompt
+        cache_prompt = f"template:{template.id}@{template.version}"
+    backend = get_backend(local_or_online, key=key)
+    model_name = backend.resolve_model(model_select)
+    messages = build_messages(system_prompt, full_text, user_prompt)
+    # 每次调用的耗时和吞吐记录到 llm_metrics，代替打印整段输入
+    call = ModelCall(backend.name, model_name, sum(estimate_tokens(m['content']) for m in messages), num_ctx, num_predict, temperature)
+    pre_out = ""
+    # 相同的后端、模型、提示词、输入和参数直接返回缓存的输出，use_cache=False 时跳过缓存
+    cache_key = None
+    if use_cache and response_cache.cacheable(temperature):
+        cache_key = response_cache.key(f"{backend.name}:{model_name}", cache_prompt, user_prompt, full_text, num_ctx, temperature, num_predict)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            call.on_delta()
+            llm_metrics.record(call, cache_hit=True)
+            yield cached
+            return
+    generated = []
+    options = {
+        "num_ctx": num_ctx ,
+        "temperature" : temperature,
+        'num_predict' : num_predict
+    }
+    # 每次调用只记录一次：正常结束、出错（记录后重新抛出）或者被取消（Gradio 关闭生成器）
+    recorded = False
+    try:
+        deltas = call.track(backend.stream_chat(model_select, messages, options, keep_alive=keep_alive, stats=call.stats))
+        async for delta in throttle(deltas, interval=stream_interval):
+            generated.append(delta)
+            if stream == False:
+                pre_out = pre_out + delta
                 #print(pre_out)
                 yield pre_out
-        except TimeoutError as t:
-            
-            print(t)
+            else:
+                yield delta
+        if cache_key is not None:
+            response_cache.put(cache_key, "".join(generated))
+        recorded = True
+        llm_metrics.record(call)
+    except TimeoutError as t:
+        recorded = True
+        llm_metrics.record(call, error=repr(t))
+        print(t)
+    except Exception as e:
+        recorded = True
+        llm_metrics.record(call, error=repr(e))
+        raise
+    finally:
+        if not recorded:
+            llm_metrics.record(call, error='cancelled')
     #print(part['message']['content'], end='', flush=True)
-    elif local_or_online == 'online':
-         
-        yield  call_stream_with_messages(full_text, model_select, system_prompt, user_prompt,  temperature, num_predict, key)
 
 
 
-def invert_find(short_text,srt_text, fuzz_param):
-    print(f'srt_text is {srt_text}')
-    last_cursor = 0
-    subs = pysubs2.SSAFile.from_string(srt_text, 'srt')                                      
-    subs_out = pysubs2.SSAFile()
-    # read short_text by line
-    for line in short_text.split('\n'):
-        matches = re.findall(r'"(.*?)"', line)
-        for match in matches:
-            split_text = re.split(r'[，,、？ 。！…：；]', match)
-            
-            for seg in split_text:
-                #print(f"seg is {seg}")
-                for i in range(last_cursor, last_cursor + len(subs)):
-                    current_index = i % len(subs)
-                    score = (fuzz.ratio(seg, subs[current_index].text))
-                    #print(f"score is {score}")
-                    if score > fuzz_param :
-                        last_cursor = current_index + 1
-                        subs_out.append(subs[current_index])
-                        break
+def invert_find(short_text,srt_text, fuzz_param, mode='cursor'):
+    """
+    在字幕中反查 short_text 引用的句子。
+
+    :param mode: 'cursor' 逐个片段从上次匹配的位置向后循环查找；
+                 'batch' 一次性对所有片段打分，做保序对齐（不会回绕）
+    """
+    from .matcher import split_segments
 
+    print(f'srt_text is {srt_text}')
+    subs = parse_srt(srt_text)
+    matcher = subs.matcher
+    segs = split_segments(short_text)
+    if mode == 'batch':
+        indices = matcher.align(segs, fuzz_param)
+    elif mode == 'cursor':
+        indices = []
+        last_cursor = 0
+        for seg in segs:
+            #print(f"seg is {seg}")
+            current_index = matcher.find(seg, fuzz_param, last_cursor)
+            if current_index is not None:
+                last_cursor = current_index + 1
+                indices.append(current_index)
+    else:
+        raise ValueError(f'Invalid invert_find mode: {mode}')
 
-    #print(subs_out.to_string('srt'))
-    return subs_out.to_string('srt')
+    #print(subs.to_srt(indices))
+    return subs.to_srt(indices)
 
 
 def get_file_list(directory):
@@ -259,69 +231,75 @@ def move_file_to(file_name, file_path="srts" ):
         new_file_name = shutil.move(file_name, file_path)
         print(f"new_file_name is {new_file_name}")
         return new_file_name
-def gen_prev_video(srt_file, video_file):
+def gen_prev_video(srt_file, video_file, max_gap_ms=500, pad_ms=0):
     video_file = video_file
     print("merge clips")
-    subs = pysubs2.SSAFile.from_string(srt_file)
+    subs = parse_srt(srt_file)
 #subs = pysubs2.load('cliped_srt/clip1.srt')
     
-    # get current timestamp as second
-    ts = int(time.time())
-    output_file = 'stream' + f'/output_{ts}.m3u8'
-
-    clips = []
-    for i in range(len(subs)):
-        sub1 = subs[i]
-        st = datetime.fromtimestamp(sub1.start/1000, pytz.timezone('utc'))
-        ed = datetime.fromtimestamp(sub1.end/1000, pytz.timezone('utc'))
-        start_time = st.strftime('%H:%M:%S.%f')[:-3] #'00:00:12.1' # Start time for trimming (HH:MM:SS)
-        end_time = ed.strftime('%H:%M:%S.%f')[:-3] # End time for trimming (HH:MM:SS)
-        print(start_time, end_time	)
-        clips.append(ffmpeg.input(video_file,  ss=start_time, to=end_time)) #hwaccel = 'cpu'
-
-    video_concat = ffmpeg.concat(*[stream['v'] for stream in clips], v=1, a=0).node
-    audio_concat = ffmpeg.concat(*[stream['a'] for stream in clips], v=0, a=1).node
-    
-    output = ffmpeg.output(video_concat['v'].filter('scale', width='640', height='478'), audio_concat['a'], output_file,format='hls', start_number=0, hls_time=10, hls_list_size=0, vcodec='h264_nvenc', init_hw_device="cuda:1") #, vcodec='h264_nvenc', acodec='copy')
-    output = ffmpeg.overwrite_output(output) 
-    
-    ffmpeg.run(output)
+    # 合并相邻的字幕区间，整个预览只打开一次源视频
+    intervals = normalize_timeline(subs.starts, subs.ends, max_gap_ms=max_gap_ms, pad_ms=pad_ms)
+    plan = plan_cuts(video_file, intervals)
+    for start, end in plan.intervals:
+        print(ms_to_timestamp(start), ms_to_timestamp(end))
+    print(f"stream copy: {plan.stream_copy}")
+
+    # 相同的视频、区间和编码参数直接复用之前的渲染结果
+    settings = {'kind': 'hls', 'stream_copy': plan.stream_copy, 'vcodec': pick_video_encoder()[0], 'size': '640x478'}
+    key = render_cache.key(video_file, plan.intervals, settings)
+    output_file = render_cache.lookup(key, '.m3u8')
+    if output_file is None:
+        output_file = render_cache.path(key, '.m3u8')
+        os.makedirs(render_cache.directory, exist_ok=True)
+        output = build_preview_output(plan, video_file, output_file)
+        import ffmpeg
+        ffmpeg.run(output)
+        render_cache.evict()
 
     #demo.load(None,None,None,js=scripts)
     #fix for gradio 5.0
     return f"/gradio_api/file="+ output_file
-def gen_download_video(srt_file, video_file):
+def gen_download_video(srt_file, video_file, max_gap_ms=500, pad_ms=0):
+    """
+    把导出任务交给后台的 render_queue，边编码边产出 [进度, 输出文件]。
+
+    Gradio 取消这个事件时会关闭生成器，同时取消后台任务。
+    """
+    from .render import render_queue, render_download_video
+
     video_file = video_file
     print("merge clips")
-    subs = pysubs2.SSAFile.from_string(srt_file)
+    subs = parse_srt(srt_file)
 #subs = pysubs2.load('cliped_srt/clip1.srt')
     
-    # get current timestamp as second
-    ts = int(time.time())
-    output_file = 'stream' + f'/output_{ts}.mp4'
-    movie = VideoFileClip(video_file)
-    clips = []
-    for i in range(len(subs)):
-        sub1 = subs[i]
-        st = datetime.fromtimestamp(sub1.start/1000, pytz.timezone('utc'))
-        ed = datetime.fromtimestamp(sub1.end/1000, pytz.timezone('utc'))
-        start_time = st.strftime('%H:%M:%S.%f')[:-3] #'00:00:12.1' # Start time for trimming (HH:MM:SS)
-        end_time = ed.strftime('%H:%M:%S.%f')[:-3] # End time for trimming (HH:MM:SS)
-        print(start_time, end_time	)
-        clips.append(movie.subclip(start_time, end_time)) #hwaccel = 'cpu'
-
-    out_clips = concatenate_videoclips(clips)
-    
-    out_clips.write_videofile(output_file, fps=24)
+    intervals = normalize_timeline(subs.starts, subs.ends, max_gap_ms=max_gap_ms, pad_ms=pad_ms)
+    key = render_cache.key(video_file, intervals, {'kind': 'mp4', 'fps': 24})
+    output_file = render_cache.lookup(key, '.mp4')
+    if output_file is not None:
+        yield ["cached", output_file]
+        return
+    output_file = render_cache.path(key, '.mp4')
+    os.makedirs(render_cache.directory, exist_ok=True)
+    job_id = render_queue.submit(render_download_video, intervals, video_file, output_file)
+    try:
+        for status, progress in render_queue.stream(job_id):
+            yield [f"{job_id} {status} {progress:.0%}", None]
+        if status == 'done':
+            render_cache.evict()
+            yield [f"{job_id} done", render_queue.result(job_id)]
+        elif status == 'failed':
+            yield [f"{job_id} failed: {render_queue.get(job_id).future.exception()}", None]
+    finally:
+        render_queue.cancel(job_id)
 
     #demo.load(None,None,None,js=scripts)
 
-    return output_file
-
 
 
 
 def translate_filename_to_pinyin(chinese_filename):
+    from pypinyin import lazy_pinyin
+
     parts = chinese_filename.split('.')
     name_part = parts[0]
     extension = parts[1] if len(parts) > 1 else ''
@@ -0,0 +1,196 @@
+import asyncio
+import contextlib
+import os
+import time
+import weakref
+
+
+class OllamaPool:
+    """
+    共享的 Ollama AsyncClient 连接池。
+
+    每个事件循环只建一个 keep-alive 的 AsyncClient，每个模型用一个信号量限制并发请求数，
+    连接失败、超时或服务端 5xx 且还没有收到任何输出时，按指数退避重试。
+
+    :param max_concurrency: 模型名 -> 最大并发请求数，没有列出的模型使用 default_concurrency
+    """
+
+    def __init__(self, host=None, max_concurrency=None, default_concurrency=2,
+                 connect_timeout=5.0, read_timeout=300.0, retries=2, backoff=0.5, max_connections=16):
+        self.host = host
+        self.max_concurrency = dict(max_concurrency or {})
+        self.default_concurrency = default_concurrency
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_connections = max_connections
+        self.retries = retries
+        self.backoff = backoff
+        # httpx 客户端和 asyncio 信号量都绑定在创建它们的事件循环上
+        self._clients = weakref.WeakKeyDictionary()
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def client(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._clients:
+            # ollama 会导入 pydantic，第一次调用模型时才加载
+            import httpx
+            from ollama import AsyncClient
+
+            self._clients[loop] = AsyncClient(
+                host=self.host,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            )
+        return self._clients[loop]
+
+    def semaphore(self, model):
+        loop = asyncio.get_running_loop()
+        semaphores = self._semaphores.setdefault(loop, {})
+        if model not in semaphores:
+            semaphores[model] = asyncio.Semaphore(self.max_concurrency.get(model, self.default_concurrency))
+        return semaphores[model]
+
+    def set_concurrency(self, model, limit):
+        """修改模型的并发上限，对之后新建的事件循环生效"""
+        self.max_concurrency[model] = limit
+
+    @staticmethod
+    def _retryable(e):
+        import httpx
+        from ollama import ResponseError
+
+        if isinstance(e, ResponseError):
+            return e.status_code >= 500
+        return isinstance(e, (ConnectionError, httpx.TransportError))
+
+    async def chat(self, model, messages, options=None, keep_alive=None, stats=None):
+        """
+        流式调用 /api/chat，逐个产出返回的 chunk。
+
+        :param stats: 可选的 dict，写入等待并发名额的时间 queue_wait_s
+        """
+        waiting = time.perf_counter()
+        async with self.semaphore(model):
+            if stats is not None:
+                stats['queue_wait_s'] = time.perf_counter() - waiting
+            for attempt in range(self.retries + 1):
+                received = False
+                try:
+                    async for chunk in await self.client().chat(model=model, messages=messages, options=options,
+                                                                keep_alive=keep_alive, stream=True):
+                        received = True
+                        yield chunk
+                    return
+                except Exception as e:
+                    if received or attempt == self.retries or not self._retryable(e):
+                        raise
+                    print(f'ollama request failed ({e}), retry {attempt + 1}/{self.retries}')
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def aclose(self):
+        with contextlib.suppress(RuntimeError):
+            client = self._clients.pop(asyncio.get_running_loop(), None)
+            if client is not None:
+                await client.close()
+
+
+def parse_model_limits(text):
+    """把 "qwen2.5:14b=1,qwen2.5:latest=3" 解析成 {模型名: 并发数}"""
+    limits = {}
+    for item in (text or '').split(','):
+        if item.strip():
+            model, _, limit = item.rpartition('=')
+            if not model.strip():
+                raise ValueError(f'Invalid model concurrency: {item!r}, expected model=limit')
+            limits[model.strip()] = int(limit)
+    return limits
+
+
+def pool_config(environ=None):
+    """
+    从环境变量读取 ollama_pool 的并发参数（每个 app 进程各自的上限）：
+    FIN_CLIP_OLLAMA_CONCURRENCY 是每个模型默认的并发请求数，
+    FIN_CLIP_OLLAMA_MODEL_CONCURRENCY 按模型覆盖，例如 "qwen2.5:14b=1,qwen2.5:latest=3"
+    """
+    environ = os.environ if environ is None else environ
+    return {
+        'default_concurrency': int(environ.get('FIN_CLIP_OLLAMA_CONCURRENCY', 2)),
+        'max_concurrency': parse_model_limits(environ.get('FIN_CLIP_OLLAMA_MODEL_CONCURRENCY')),
+    }
+
+
+ollama_pool = OllamaPool(**pool_config())
+
+
+def build_messages(system_prompt, full_text, user_prompt):
+    """用 user_prompt 模板包装 full_text，组成对话消息"""
+    return [
+        {'role': 'system', 'content': system_prompt},
+        {'role': 'user', 'content': user_prompt.format(full_text)},
+    ]
+
+
+async def ollama_generate(system_prompt, full_text, model_select, user_prompt, options=None, keep_alive=-1, pool=None):
+    """用 user_prompt 包装 full_text 调用模型，逐个产出增量文本"""
+    pool = pool or ollama_pool
+    messages = build_messages(system_prompt, full_text, user_prompt)
+    async for chunk in pool.chat(model=model_select, messages=messages, options=options, keep_alive=keep_alive):
+        yield chunk['message']['content']
+
+
+async def throttle(deltas, interval=0.05, max_parts=32):
+    """
+    合并增量输出：距离上次产出超过 interval 秒，或者攒够 max_parts 个增量时才产出一次拼接后的增量。
+    """
+    buf = []
+    last = time.monotonic()
+    async for delta in deltas:
+        buf.append(delta)
+        now = time.monotonic()
+        if len(buf) >= max_parts or now - last >= interval:
+            yield ''.join(buf)
+            buf = []
+            last = now
+    if buf:
+        yield ''.join(buf)
+
+
+async def ordered_fan_out(items, generate, concurrency=4):
+    """
+    并发处理多个文档块，按文档顺序合并输出。
+
+    :param generate: generate(item) 是产出该块累计输出的异步生成器
+    :return: 异步生成器，任意一块有新输出时产出按顺序拼接的全部输出
+    """
+    outputs = [''] * len(items)
+    updates = asyncio.Queue()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def worker(i, item):
+        async with semaphore:
+            async for out in generate(item):
+                outputs[i] = out.strip()
+                updates.put_nowait(i)
+
+    async def run_all():
+        tasks = [asyncio.create_task(worker(i, item)) for i, item in enumerate(items)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            updates.put_nowait(None)
+
+    runner = asyncio.create_task(run_all())
+    try:
+        while True:
+            i = await updates.get()
+            # 合并队列里积压的更新，只产出一次
+            while i is not None and not updates.empty():
+                i = updates.get_nowait()
+            yield ''.join(out + '\n' for out in outputs if out)
+            if i is None:
+                break
+        await runner
+    finally:
+        runner.cancel()
@@ -0,0 +1,125 @@
+import itertools
+import re
+from collections import Counter
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from .subs import parse_srt
+
+
+class SubtitleMatcher:
+    """
+    字幕行的字符倒排索引，用于快速查找 fuzz.ratio 超过阈值的字幕行。
+
+    fuzz.ratio = 200 * LCS / (len1 + len2)，而 LCS 不会超过两个字符串的字符多重集交集，
+    因此可以先用倒排索引算出每一行的字符交集上界，只对可能超过阈值的行调用 fuzz.ratio。
+    """
+
+    scan_window = 16
+
+    def __init__(self, texts):
+        self.texts = list(texts)
+        self.lengths = np.array([len(t) for t in self.texts], dtype=np.int32)
+        postings = {}
+        for line_no, text in enumerate(self.texts):
+            for ch, cnt in Counter(text).items():
+                postings.setdefault(ch, ([], []))
+                postings[ch][0].append(line_no)
+                postings[ch][1].append(cnt)
+        self.postings = {
+            ch: (np.array(ids, dtype=np.int32), np.array(cnts, dtype=np.int32))
+            for ch, (ids, cnts) in postings.items()
+        }
+
+    def __len__(self):
+        return len(self.texts)
+
+    def candidates(self, seg, fuzz_param):
+        """返回 fuzz.ratio(seg, line) 可能大于 fuzz_param 的行号（升序）"""
+        overlap = np.zeros(len(self.texts), dtype=np.int32)
+        for ch, cnt in Counter(seg).items():
+            if ch in self.postings:
+                ids, cnts = self.postings[ch]
+                overlap[ids] += np.minimum(cnts, cnt)
+        lensum = self.lengths + len(seg)
+        bound = np.full(len(self.texts), 100.0)
+        np.divide(200.0 * overlap, lensum, out=bound, where=lensum > 0)
+        return np.nonzero(bound + 1e-9 > fuzz_param)[0]
+
+    def find(self, seg, fuzz_param, cursor=0):
+        """
+        从 cursor 开始循环查找第一个 fuzz.ratio 大于 fuzz_param 的字幕行。
+
+        :return: 匹配的行号，没有找到时返回 None
+        """
+        n = len(self.texts)
+        if n == 0:
+            return None
+        cursor %= n
+        # 匹配通常紧跟在上一次匹配之后，先直接检查附近的几行，再用索引查剩下的行
+        window = min(self.scan_window, n)
+        for i in range(cursor, cursor + window):
+            if fuzz.ratio(seg, self.texts[i % n]) > fuzz_param:
+                return i % n
+        if window == n:
+            return None
+        rest = (cursor + window) % n
+        cands = self.candidates(seg, fuzz_param)
+        if rest > cursor:
+            cands = cands[(cands < cursor) | (cands >= rest)]
+        else:
+            cands = cands[(cands >= rest) & (cands < cursor)]
+        split = np.searchsorted(cands, rest)
+        for i in itertools.chain(cands[split:].tolist(), cands[:split].tolist()):
+            if fuzz.ratio(seg, self.texts[i]) > fuzz_param:
+                return i
+        return None
+
+    def align(self, segs, fuzz_param):
+        """
+        一次性对所有片段打分并做保序对齐。
+
+        用 process.cdist 在原生多线程里算出 片段 x 字幕行 的得分矩阵，再用动态规划选出
+        行号严格递增、总得分最高的匹配，每个片段最多匹配一行，得分需大于 fuzz_param。
+
+        :return: 按顺序匹配到的行号列表
+        """
+        if not segs or not self.texts:
+            return []
+        scores = process.cdist(segs, self.texts, scorer=fuzz.ratio, workers=-1)
+        weights = np.where(scores > fuzz_param, scores, -np.inf)
+        # best[i][j]: 前 i 个片段只使用前 j 行时的最大总得分
+        best = np.zeros((len(segs) + 1, len(self.texts) + 1))
+        for i in range(len(segs)):
+            take = best[i, :-1] + weights[i]
+            best[i + 1] = best[i]
+            np.maximum(best[i + 1, 1:], take, out=best[i + 1, 1:])
+            np.maximum.accumulate(best[i + 1], out=best[i + 1])
+        # 回溯
+        out = []
+        j = len(self.texts)
+        for i in range(len(segs), 0, -1):
+            while j > 0 and best[i, j] == best[i, j - 1]:
+                j -= 1
+            if j > 0 and best[i, j] != best[i - 1, j]:
+                out.append(j - 1)
+                j -= 1
+        out.reverse()
+        return out
+
+
+def get_matcher(srt):
+    """每个 SRT 只建一次索引，随解析缓存一起在多次 clip 请求间复用"""
+    return parse_srt(srt).matcher
+
+
+def split_segments(short_text):
+    """取出 short_text 中每个引号内的内容，并按标点切分成片段"""
+    segs = []
+    # read short_text by line
+    for line in short_text.split('\n'):
+        matches = re.findall(r'"(.*?)"', line)
+        for match in matches:
+            segs.extend(re.split(r'[，,、？ 。！…：；]', match))
+    return segs
@@ -0,0 +1,140 @@
+import json
+import os
+import statistics
+import threading
+import time
+from collections import deque
+
+
+class ModelCall:
+    """一次模型调用的计时：排队等待、首 token 延迟、总耗时和输出 token 数"""
+
+    def __init__(self, backend, model, prompt_tokens, num_ctx=None, num_predict=None, temperature=None):
+        self.backend = backend
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.num_ctx = num_ctx
+        self.num_predict = num_predict
+        self.temperature = temperature
+        # 后端可以写入 queue_wait_s、eval_count、prompt_eval_count
+        self.stats = {}
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.chunks = 0
+
+    def on_delta(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.chunks += 1
+
+    async def track(self, deltas):
+        """在合并（throttle）之前逐个统计后端产出的增量，后端没有报告 eval_count 时用它当输出 token 数"""
+        async for delta in deltas:
+            self.on_delta()
+            yield delta
+
+    def to_record(self, cache_hit=False, error=None):
+        now = time.perf_counter()
+        total = now - self.started
+        ttft = self.first_token_at - self.started if self.first_token_at is not None else None
+        tokens = self.stats.get('eval_count') or self.chunks
+        generating = now - self.first_token_at if self.first_token_at is not None else 0
+        return {
+            'ts': time.time(),
+            'backend': self.backend,
+            'model': self.model,
+            'cache_hit': cache_hit,
+            'error': error,
+            'queue_wait_s': self.stats.get('queue_wait_s', 0.0),
+            'ttft_s': ttft,
+            'total_s': total,
+            'prompt_tokens': self.stats.get('prompt_eval_count') or self.prompt_tokens,
+            'output_tokens': tokens,
+            'tokens_per_s': tokens / generating if generating > 0 else None,
+            'num_ctx': self.num_ctx,
+            'num_predict': self.num_predict,
+            'temperature': self.temperature,
+        }
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class MetricsRecorder:
+    """
+    记录每次模型调用的指标：追加写入 JSONL 日志，并在内存里保留最近 keep 条用于汇总。
+
+    :param log_path: JSONL 日志路径，为 None 时只保存在内存里
+    """
+
+    def __init__(self, log_path='logs/llm_calls.jsonl', keep=2000):
+        self.log_path = log_path
+        self._records = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def record(self, call, cache_hit=False, error=None):
+        record = call.to_record(cache_hit=cache_hit, error=error)
+        with self._lock:
+            self._records.append(record)
+            if self.log_path:
+                if os.path.dirname(self.log_path):
+                    os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return record
+
+    def records(self):
+        with self._lock:
+            return list(self._records)
+
+    def summary(self):
+        """按 (后端, 模型) 汇总：调用次数、缓存命中率、排队/首 token/总耗时分位数、平均吞吐"""
+        groups = {}
+        for record in self.records():
+            groups.setdefault((record['backend'], record['model']), []).append(record)
+        rows = []
+        for (backend, model), records in sorted(groups.items()):
+            calls = [r for r in records if not r['cache_hit'] and not r['error']]
+            ttft = [r['ttft_s'] for r in calls if r['ttft_s'] is not None]
+            total = [r['total_s'] for r in calls]
+            rates = [r['tokens_per_s'] for r in calls if r['tokens_per_s']]
+            rows.append({
+                'backend': backend,
+                'model': model,
+                'calls': len(records),
+                'cache_hit_rate': sum(r['cache_hit'] for r in records) / len(records),
+                'errors': sum(1 for r in records if r['error']),
+                'queue_wait_p50_s': _percentile([r['queue_wait_s'] for r in calls], 0.5),
+                'ttft_p50_s': _percentile(ttft, 0.5),
+                'ttft_p95_s': _percentile(ttft, 0.95),
+                'total_p50_s': _percentile(total, 0.5),
+                'total_p95_s': _percentile(total, 0.95),
+                'tokens_per_s_mean': statistics.mean(rates) if rates else None,
+                'prompt_tokens_mean': statistics.mean(r['prompt_tokens'] for r in calls) if calls else None,
+            })
+        return rows
+
+    def summary_table(self):
+        """summary() 转成 Gradio Dataframe 用的 (表头, 行)"""
+        rows = self.summary()
+        headers = ['backend', 'model', 'calls', 'cache_hit_rate', 'errors', 'queue_wait_p50_s', 'ttft_p50_s',
+                   'ttft_p95_s', 'total_p50_s', 'total_p95_s', 'tokens_per_s_mean', 'prompt_tokens_mean']
+        return headers, [[round(row[h], 3) if isinstance(row[h], float) else row[h] for h in headers] for row in rows]
+
+    def prometheus_text(self):
+        """Prometheus 文本格式的汇总指标"""
+        lines = []
+        for row in self.summary():
+            labels = f'backend="{row["backend"]}",model="{row["model"]}"'
+            for name in ('calls', 'cache_hit_rate', 'errors', 'queue_wait_p50_s', 'ttft_p50_s', 'ttft_p95_s',
+                         'total_p50_s', 'total_p95_s', 'tokens_per_s_mean'):
+                if row[name] is not None:
+                    lines.append(f'fin_clip_llm_{name}{{{labels}}} {row[name]}')
+        return '\n'.join(lines) + '\n'
+
+
+llm_metrics = MetricsRecorder()
@@ -0,0 +1,216 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from proglog import ProgressBarLogger
+
+from .video import ms_to_timestamp
+
+
+class RenderCancelled(Exception):
+    pass
+
+
+class JobProgressLogger(ProgressBarLogger):
+    """moviepy 的进度回调：把进度发回主进程，并在任务被取消时中断编码"""
+
+    def __init__(self, job_id, events, cancel_event):
+        super().__init__()
+        self.job_id = job_id
+        self.events = events
+        self.cancel_event = cancel_event
+        self.last_percent = -1
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if self.cancel_event.is_set():
+            raise RenderCancelled(self.job_id)
+        total = self.bars[bar].get('total')
+        if attr == 'index' and total:
+            percent = int(100 * value / total)
+            if percent != self.last_percent:
+                self.last_percent = percent
+                self.events.put((self.job_id, percent / 100))
+
+
+# 每个工作进程缓存最近打开的几个视频，同一个源视频多次导出时不再重复打开
+MAX_OPEN_MOVIES = int(os.getenv('FIN_CLIP_RENDER_OPEN_MOVIES', 2))
+_movies = OrderedDict()
+
+
+def _open_movie(video_file):
+    """按 (路径, 修改时间) 缓存 VideoFileClip（LRU），文件被替换或者被淘汰时关闭旧的 clip"""
+    from moviepy import VideoFileClip
+
+    path = os.path.abspath(video_file)
+    key = (path, os.stat(path).st_mtime_ns)
+    if key in _movies:
+        _movies.move_to_end(key)
+        return _movies[key]
+    for stale in [k for k in _movies if k[0] == path]:
+        _movies.pop(stale).close()
+    _movies[key] = VideoFileClip(video_file)
+    while len(_movies) > MAX_OPEN_MOVIES:
+        _, evicted = _movies.popitem(last=False)
+        evicted.close()
+    return _movies[key]
+
+
+def render_download_video(intervals, video_file, output_file, job_id, events, cancel_event, fps=24):
+    """在工作进程里用 moviepy 按区间剪辑并导出 mp4"""
+    from moviepy import concatenate_videoclips
+
+    movie = _open_movie(video_file)
+    clips = []
+    for start, end in intervals:
+        end = min(end, int(movie.duration * 1000))
+        print(ms_to_timestamp(start), ms_to_timestamp(end))
+        clips.append(movie.subclipped(start / 1000, end / 1000))
+    out_clips = concatenate_videoclips(clips)
+    # 先写到 .part 文件，编码完成后再改名，缓存里不会出现不完整的输出；
+    # moviepy 的临时音频也放在缓存目录里，失败或取消时一起删掉
+    base, ext = os.path.splitext(output_file)
+    part_file = base + '.part' + ext
+    temp_audio = base + '.part.mp3'
+    try:
+        out_clips.write_videofile(part_file, fps=fps, temp_audiofile=temp_audio,
+                                  logger=JobProgressLogger(job_id, events, cancel_event))
+    except BaseException:
+        for path in (part_file, temp_audio):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    os.replace(part_file, output_file)
+    return output_file
+
+
+class RenderJob:
+    def __init__(self, job_id, cancel_event):
+        self.job_id = job_id
+        self.cancel_event = cancel_event
+        self.future = None
+        self.cancelled = False
+        self.progress = 0.0
+        self.created_at = time.time()
+
+    @property
+    def done(self):
+        return self.cancelled or (self.future is not None and self.future.done())
+
+    @property
+    def status(self):
+        if self.cancelled:
+            return 'cancelled'
+        if self.future is None:
+            return 'queued'
+        if not self.future.done():
+            return 'running'
+        return 'failed' if self.future.exception() else 'done'
+
+
+class RenderQueue:
+    """
+    视频导出任务队列。任务在独立的进程池里编码，最多同时运行 max_workers 个，
+    其余任务在队列里等待；进度通过共享队列发回，可以按任务 ID 查询、流式读取进度或取消。
+    """
+
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self._jobs = {}
+        self._pending = deque()
+        self._lock = threading.RLock()
+        self._executor = None
+        self._manager = None
+        self._events = None
+
+    def _start(self):
+        if self._executor is None:
+            ctx = multiprocessing.get_context('spawn')
+            self._manager = ctx.Manager()
+            self._events = self._manager.Queue()
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=ctx)
+
+    def submit(self, fn, *args, **kwargs):
+        """提交任务，fn 需要接受 job_id, events, cancel_event 关键字参数；返回任务 ID"""
+        with self._lock:
+            self._start()
+            self._prune()
+            job_id = uuid.uuid4().hex[:8]
+            job = RenderJob(job_id, self._manager.Event())
+            self._jobs[job_id] = job
+            self._pending.append((job, fn, args, kwargs))
+            self._dispatch()
+        return job_id
+
+    def _dispatch(self, _future=None):
+        # 进程池自己也会预取任务，所以只在有空闲进程时才交给它，排队中的任务可以直接取消
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job.future is not None and not job.future.done())
+            while self._pending and running < self.max_workers:
+                job, fn, args, kwargs = self._pending.popleft()
+                job.future = self._executor.submit(
+                    fn, *args, job_id=job.job_id, events=self._events, cancel_event=job.cancel_event, **kwargs)
+                running += 1
+                job.future.add_done_callback(self._dispatch)
+
+    def get(self, job_id):
+        self._drain()
+        return self._jobs[job_id]
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.done:
+                return False
+            job.cancelled = True
+            if job.future is None:
+                self._pending = deque(item for item in self._pending if item[0] is not job)
+            else:
+                job.cancel_event.set()
+            return True
+
+    def result(self, job_id, timeout=None):
+        return self._jobs[job_id].future.result(timeout=timeout)
+
+    def stream(self, job_id, interval=0.5):
+        """直到任务结束前，每隔 interval 秒产出一次 (状态, 进度)"""
+        job = self._jobs[job_id]
+        while not job.done:
+            self._drain()
+            yield job.status, job.progress
+            time.sleep(interval)
+        self._drain()
+        yield job.status, job.progress
+
+    def _prune(self, keep_seconds=3600):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.done and now - job.created_at > keep_seconds:
+                del self._jobs[job_id]
+
+    def _drain(self):
+        if self._events is None:
+            return
+        with self._lock:
+            while True:
+                try:
+                    job_id, progress = self._events.get_nowait()
+                except queue.Empty:
+                    break
+                if job_id in self._jobs:
+                    self._jobs[job_id].progress = progress
+
+    def shutdown(self):
+        for job_id in list(self._jobs):
+            self.cancel(job_id)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._manager.shutdown()
+
+
+# 每个 app 进程各自的编码进程数
+render_queue = RenderQueue(max_workers=int(os.getenv('FIN_CLIP_RENDER_PROCESSES', 2)))
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import re
+import time
+
+
+def video_fingerprint(video_file):
+    """源视频指纹：绝对路径、大小、修改时间和文件开头 64KB 的哈希"""
+    stat = os.stat(video_file)
+    with open(video_file, 'rb') as f:
+        head = hashlib.sha1(f.read(65536)).hexdigest()
+    return [os.path.abspath(video_file), stat.st_size, stat.st_mtime_ns, head]
+
+
+class RenderCache:
+    """
+    按内容寻址的渲染结果缓存。
+
+    输出文件名由 (源视频指纹, 整理后的区间列表, 编码参数) 的哈希决定，相同的请求直接复用；
+    目录里 output_* 文件总大小超过 max_bytes 时，按最近使用时间淘汰最旧的一组输出。
+
+    :param part_max_age: .part 文件超过这么多秒没有更新，就当作中断的渲染留下的，淘汰时删除
+    """
+
+    def __init__(self, directory='stream', max_bytes=5 * 1024 ** 3, part_max_age=6 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.part_max_age = part_max_age
+
+    def key(self, video_file, intervals, settings):
+        payload = json.dumps([video_fingerprint(video_file), [list(i) for i in intervals], settings], sort_keys=True)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:20]
+
+    def path(self, key, ext):
+        return os.path.join(self.directory, f'output_{key}{ext}')
+
+    def lookup(self, key, ext):
+        """返回已经渲染完成的输出路径并刷新其使用时间，没有时返回 None"""
+        output_file = self.path(key, ext)
+        if not os.path.exists(output_file):
+            return None
+        if ext == '.m3u8':
+            # HLS 播放列表在 ffmpeg 正常结束时才会写入 ENDLIST
+            with open(output_file, 'r', encoding='utf-8') as f:
+                if '#EXT-X-ENDLIST' not in f.read():
+                    return None
+        for name in self._groups().get(f'output_{key}', []):
+            os.utime(os.path.join(self.directory, name))
+        return output_file
+
+    def _groups(self):
+        """把 output_* 文件按所属的一次输出分组（播放列表、切片、concat 列表等）"""
+        groups = {}
+        if not os.path.isdir(self.directory):
+            return groups
+        for name in os.listdir(self.directory):
+            if name.startswith('output_'):
+                stem = re.sub(r'_\d{5}$', '', name.split('.')[0])
+                groups.setdefault(stem, []).append(name)
+        return groups
+
+    def evict(self):
+        """
+        淘汰最久没有使用的输出，直到总大小不超过 max_bytes。
+
+        正在渲染的输出（有最近更新过的 .part 文件）不会被删除；超过 part_max_age 的 .part 文件先删掉。
+        """
+        groups = []
+        total = 0
+        stale_before = time.time() - self.part_max_age
+        for stem, names in self._groups().items():
+            paths = [os.path.join(self.directory, name) for name in names]
+            stats = {p: os.stat(p) for p in paths}
+            parts = [p for p in paths if '.part' in os.path.basename(p)]
+            if parts:
+                if max(stats[p].st_mtime for p in parts) >= stale_before:
+                    total += sum(st.st_size for st in stats.values())
+                    continue
+                for p in parts:
+                    os.remove(p)
+                    paths.remove(p)
+                print(f'render cache: removed {len(parts)} stale part files of {stem}')
+            if paths:
+                size = sum(stats[p].st_size for p in paths)
+                total += size
+                groups.append((max(stats[p].st_mtime for p in paths), size, paths))
+        removed = 0
+        for _, size, paths in sorted(groups):
+            if total <= self.max_bytes:
+                break
+            for p in paths:
+                os.remove(p)
+            total -= size
+            removed += 1
+        if removed:
+            print(f'render cache: evicted {removed} outputs, {total / 1024 ** 2:.0f} MB left')
+        return removed
+
+
+render_cache = RenderCache()
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    持久化的 LLM 输出缓存（SQLite）。
+
+    键是 (模型, 系统提示词, 用户提示词模板, 输入文本哈希, num_ctx, temperature, num_predict) 的哈希，
+    条目数超过 max_entries 时按最近使用时间淘汰。默认只缓存 temperature 为 0 的确定性调用。
+    """
+
+    def __init__(self, db_path='db/llm_cache.sqlite', max_entries=2000, only_deterministic=True):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.only_deterministic = only_deterministic
+        self.enabled = True
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            if os.path.dirname(self.db_path):
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS responses ('
+                               'key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)')
+        return self._conn
+
+    def cacheable(self, temperature):
+        return self.enabled and (not self.only_deterministic or temperature == 0)
+
+    @staticmethod
+    def key(model, system_prompt, user_prompt, full_text, num_ctx, temperature, num_predict):
+        text_hash = hashlib.sha256(full_text.encode('utf-8')).hexdigest()
+        payload = json.dumps([model, system_prompt, user_prompt, text_hash, num_ctx, temperature, num_predict])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (time.time(), key))
+            conn.commit()
+            return row[0]
+
+    def put(self, key, response):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute('INSERT OR REPLACE INTO responses (key, response, created, last_used) VALUES (?, ?, ?, ?)',
+                         (key, response, now, now))
+            conn.execute('DELETE FROM responses WHERE key IN ('
+                         'SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute('DELETE FROM responses')
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,55 @@
+import os
+from collections import namedtuple
+
+# 生产模式的服务参数。并发上限都是每个 app 进程各自的，总量要乘以 workers
+ServingConfig = namedtuple('ServingConfig', [
+    'host', 'port', 'workers',
+    'llm_concurrency', 'render_concurrency', 'text_concurrency',
+    'max_queue_size', 'shared_dir',
+])
+
+# 事件类别：llm 是模型生成，render 是视频导出，text 是读文件、统计字数这类很快的操作
+EVENT_KINDS = ('llm', 'render', 'text')
+
+
+def serving_config(environ=None):
+    """从环境变量（FIN_CLIP_*）读取服务参数，没有设置时使用单进程开发模式的默认值"""
+    environ = os.environ if environ is None else environ
+    return ServingConfig(
+        host=environ.get('FIN_CLIP_HOST', '127.0.0.1'),
+        port=int(environ.get('FIN_CLIP_PORT', 17777)),
+        workers=int(environ.get('FIN_CLIP_WORKERS', 1)),
+        llm_concurrency=int(environ.get('FIN_CLIP_LLM_CONCURRENCY', 4)),
+        render_concurrency=int(environ.get('FIN_CLIP_RENDER_CONCURRENCY', 2)),
+        text_concurrency=int(environ.get('FIN_CLIP_TEXT_CONCURRENCY', 16)),
+        max_queue_size=int(environ.get('FIN_CLIP_MAX_QUEUE_SIZE', 64)) or None,
+        shared_dir=environ.get('FIN_CLIP_SHARED_DIR') or None,
+    )
+
+
+def event_limits(config, kind):
+    """
+    Gradio 事件的并发参数。同一类别的事件共用一个 concurrency_id，
+    一个长时间的导出任务只占 render 的名额，不会挡住模型生成和文本操作。
+    """
+    if kind not in EVENT_KINDS:
+        raise ValueError(f'Invalid event kind: {kind}')
+    return {'concurrency_id': kind, 'concurrency_limit': getattr(config, f'{kind}_concurrency')}
+
+
+def queue_kwargs(config):
+    """demo.queue() 的参数：队列满了以后新请求直接被拒绝，而不是无限排队"""
+    return {'default_concurrency_limit': config.text_concurrency, 'max_size': config.max_queue_size}
+
+
+def worker_env(config, index, environ=None):
+    """
+    第 index 个 app 进程的环境变量：端口依次加一，
+    共享目录下的字幕缓存让各进程都能解析其他进程发出的字幕句柄。
+    """
+    env = dict(os.environ if environ is None else environ)
+    env['FIN_CLIP_PORT'] = str(config.port + index)
+    env['FIN_CLIP_WORKERS'] = '1'
+    if config.shared_dir:
+        env.setdefault('FIN_CLIP_SHARED_SRT_DIR', os.path.join(config.shared_dir, 'srt'))
+    return env
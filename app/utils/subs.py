@@ -0,0 +1,192 @@
+import hashlib
+import os
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+
+HANDLE_PREFIX = 'srt:'
+
+
+class SubtitleTable:
+    """
+    列式存储的字幕表。
+
+    开始/结束时间是 int32 毫秒数组，全部文本拼在一个字符串里（每行以换行结尾），
+    offsets[i] 是第 i 行在文本中的起始位置，不保留逐行的 SSAEvent 对象。
+    """
+
+    __slots__ = ('starts', 'ends', 'offsets', 'full_text', '_matcher')
+
+    def __init__(self, starts, ends, texts):
+        self.starts = array('i', starts)
+        self.ends = array('i', ends)
+        self.full_text = ''.join(text + '\n' for text in texts)
+        self.offsets = array('i', [0])
+        pos = 0
+        for text in texts:
+            pos += len(text) + 1
+            self.offsets.append(pos)
+        self._matcher = None
+
+    @classmethod
+    def from_ssafile(cls, subs):
+        return cls((line.start for line in subs), (line.end for line in subs), [line.text for line in subs])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def text(self, i):
+        """第 i 行的文本"""
+        return self.full_text[self.offsets[i]:self.offsets[i + 1] - 1]
+
+    def iter_texts(self):
+        full_text, offsets = self.full_text, self.offsets
+        for i in range(len(self)):
+            yield full_text[offsets[i]:offsets[i + 1] - 1]
+
+    def index_at(self, ms):
+        """返回 ms 时刻正在显示的字幕行号，没有时返回 None"""
+        i = bisect_right(self.starts, ms) - 1
+        if i >= 0 and ms < self.ends[i]:
+            return i
+        return None
+
+    def line_at_offset(self, pos):
+        """返回 full_text 中位置 pos 所在的字幕行号"""
+        return bisect_right(self.offsets, pos) - 1
+
+    @property
+    def matcher(self):
+        """按需建立的模糊匹配索引，随字幕一起缓存"""
+        if self._matcher is None:
+            from .matcher import SubtitleMatcher
+            self._matcher = SubtitleMatcher(self.iter_texts())
+        return self._matcher
+
+    def char_count(self):
+        return len(self.full_text)
+
+    def to_ssafile(self, indices=None):
+        import pysubs2
+
+        subs = pysubs2.SSAFile()
+        for i in (range(len(self)) if indices is None else indices):
+            subs.append(pysubs2.SSAEvent(start=self.starts[i], end=self.ends[i], text=self.text(i)))
+        return subs
+
+    def to_srt(self, indices=None):
+        return self.to_ssafile(indices).to_string('srt')
+
+
+class SrtCache:
+    """
+    以内容哈希为键的字幕解析缓存（LRU）。
+
+    :param max_entries: 最多缓存的字幕文件数
+    :param max_chars: 所有缓存字幕的文本总字符数上限
+    :param shared_dir: 多个 app 进程共用的目录，load() 读入的字幕文本按句柄写在这里，
+                       其他进程拿到本进程发出的句柄时可以从这里读取
+
+    Gradio 的多个请求线程共用一个实例：解析在锁外进行，缓存的读写在锁内。
+    """
+
+    def __init__(self, max_entries=16, max_chars=20_000_000, shared_dir=None):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.shared_dir = shared_dir
+        self._entries = OrderedDict()
+        self._chars = 0
+        # 句柄 -> 来源文件路径，缓存被淘汰后可以从文件重新解析
+        self._sources = {}
+        # get -> load -> put_text 会重入
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, handle):
+        return handle in self._entries
+
+    def put_text(self, srt_text, source=None, persist=False):
+        """
+        解析字幕文本并缓存，返回句柄；相同内容只解析一次。
+
+        :param persist: 同时写进 shared_dir。只有 load() 读入的字幕会以句柄的形式交给界面，
+                        invert_find 等中间结果不写，避免目录无限增长
+        """
+        handle = HANDLE_PREFIX + hashlib.sha1(srt_text.encode('utf-8')).hexdigest()[:20]
+        if source is not None:
+            with self._lock:
+                self._sources[handle] = source
+        if persist and self.shared_dir and not os.path.exists(self._shared_path(handle)):
+            os.makedirs(self.shared_dir, exist_ok=True)
+            part = f'{self._shared_path(handle)}.{os.getpid()}.part'
+            with open(part, 'w', encoding='utf-8') as f:
+                f.write(srt_text)
+            os.replace(part, self._shared_path(handle))
+        with self._lock:
+            if handle in self._entries:
+                self._entries.move_to_end(handle)
+                return handle
+        import pysubs2
+        parsed = SubtitleTable.from_ssafile(pysubs2.SSAFile.from_string(srt_text))
+        with self._lock:
+            # 另一个线程可能刚解析完同样的内容，不能重复计入 _chars
+            if handle in self._entries:
+                self._entries.move_to_end(handle)
+            else:
+                self._insert(handle, parsed)
+        return handle
+
+    def load(self, srt_file):
+        with open(srt_file, 'r', encoding='utf-8') as f:
+            return self.put_text(f.read(), source=srt_file, persist=True)
+
+    def get(self, handle):
+        with self._lock:
+            if handle in self._entries:
+                self._entries.move_to_end(handle)
+                return self._entries[handle]
+            source = self._sources.get(handle)
+        if source is not None and os.path.exists(source):
+            self.load(source)
+            with self._lock:
+                if handle in self._entries:
+                    return self._entries[handle]
+        if self.shared_dir and os.path.exists(self._shared_path(handle)):
+            with open(self._shared_path(handle), 'r', encoding='utf-8') as f:
+                self.put_text(f.read())
+            with self._lock:
+                if handle in self._entries:
+                    return self._entries[handle]
+        raise KeyError(f'SRT handle {handle} is not cached, please reload the srt file')
+
+    def _shared_path(self, handle):
+        return os.path.join(self.shared_dir, handle[len(HANDLE_PREFIX):] + '.srt')
+
+    def _insert(self, handle, parsed):
+        self._entries[handle] = parsed
+        self._chars += parsed.char_count()
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._chars > self.max_chars):
+            _, evicted = self._entries.popitem(last=False)
+            self._chars -= evicted.char_count()
+
+
+srt_cache = SrtCache(shared_dir=os.getenv('FIN_CLIP_SHARED_SRT_DIR') or None)
+
+
+def is_srt_handle(value):
+    return isinstance(value, str) and value.startswith(HANDLE_PREFIX) and '\n' not in value
+
+
+def parse_srt(srt):
+    """
+    取得解析后的字幕。
+
+    :param srt: srt_cache 的句柄或者字幕文本
+    :return: SubtitleTable
+    """
+    if is_srt_handle(srt):
+        return srt_cache.get(srt)
+    return srt_cache.get(srt_cache.put_text(srt))
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import threading
+from collections import namedtuple
+
+# 一个模板版本：id 是 "key/desc"，version 是提示词内容的哈希，内容不变时版本不变
+Template = namedtuple('Template', ['id', 'key', 'desc', 'version', 'prompt', 'source'])
+
+# 短视频类型对应的系统提示词，原来写在 functions.load_d_templates 里
+D_TEMPLATES = {
+    "科普类":'''你是一名科普类短视频博主，你的主要观众在小红书。你需要从科技类演讲的速记稿中寻找适合做科普短视频的案例和包含案例前因后果的具体文字。你需要对速记稿中的每一个案例内容进行仔细打分，得分点如下：
+1. 故事情节的完整程度，加0到10分
+3. 激发读者的画面感的生动程度，加0到10分
+4. 细节动作描写的连贯程度，加0到10分
+5. 文字中提到日常工作生活会用到的物品的流行程度，加0到10分
+6. 问题解决前后对比的差异程度，加0-10分
+7. 面向观众人群理解的通俗程度，加0-10分
+打分过程示例：
+得分点1得分5分，得分点2得分3分，得分点3得分0分。最后得分：5+3+0=8 分
+你需要一步一步的思考如何完成工作，先找出符合需求的案例进行打分，再输出得分最高的5个案例。
+输出的格式如下：
+第一步：找出案例并打分
+1. 案例：[案例的具体文字]，得分点：[得分点]，分数：[分数]，
+1. 案例：[案例的具体文字]，得分点：[得分点]，分数：[分数]，
+第二步：输出得分最高的5个案例''',
+
+
+    "教培类":'''你是一名科普类短视频博主，你的主要观众在小红书。你需要从科技类演讲的速记稿中寻找适合做科普短视频的案例和包含案例前因后果的具体文字。你需要对速记稿中的每一个案例内容进行仔细打分，注意你打分的评价标准是参加信息学竞赛的家长的接受度和喜爱程度。得分点如下：
+1. 故事情节的完整程度，加0到10分
+3. 激发读者的画面感的生动程度，加0到10分
+4. 细节动作描写的连贯程度，加0到10分
+5. 文字中提到日常工作生活会用到的物品的流行程度，加0到10分
+6. 问题解决前后对比的差异程度，加0-10分
+7. 面向观众人群理解的通俗程度，加0-10分
+8. 引发家长的焦虑程度，加0-10分
+打分过程示例：
+得分点1得分5分，得分点2得分3分，得分点3得分0分。最后得分：5+3+0=8 分
+你需要一步一步的思考如何完成工作，先找出符合需求的案例进行打分，再输出得分最高的5个案例。
+输出的格式如下：
+第一步：找出案例并打分
+1. 案例：[案例的具体文字]，得分点：[得分点]，分数：[分数]，
+1. 案例：[案例的具体文字]，得分点：[得分点]，分数：[分数]，
+第二步：输出得分最高的5个案例''',
+
+
+
+    "爱国类":"",
+}
+
+
+def read_template_file(json_file):
+    """
+    读取模板 JSON 文件，返回 [{'key', 'desc', 'prompt'}, ...]。
+
+    支持模板列表和 TinyDB 格式（{"_default": {"1": {...}}}），空文件返回空列表。
+    """
+    with open(json_file, 'r', encoding='utf-8') as f:
+        text = f.read()
+    if not text.strip():
+        return []
+    data = json.loads(text)
+    if isinstance(data, list):
+        return data
+    records = []
+    for table in data.values():
+        records.extend(d for _, d in sorted(table.items(), key=lambda item: int(item[0])))
+    return records
+
+
+class TemplateRegistry:
+    """
+    提示词模板注册表，第一次使用时从所有来源加载一次，之后只查内存索引。
+
+    来源依次是 D_TEMPLATES（key 为 d_templates）、模板 JSON 文件和提示词库（dbs.PromptStore）。
+    提示词库被其他 app 进程写入后（PRAGMA data_version 变化）重新导入，新提示词在每个进程都能按 id 引用。
+    同一个 id 的提示词内容变化时追加一个新版本，get(id) 返回最新版本，get("id@version") 返回指定版本。
+    """
+
+    def __init__(self, template_files=('templates/srt_chunk_prompt_templates.json',), prompt_dbs=('db/prompts.json',)):
+        self.template_files = template_files
+        self.prompt_dbs = prompt_dbs
+        self._versions = {}
+        self._by_key = {}
+        self._loaded = False
+        self._db_versions = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def version_of(prompt):
+        return hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:12]
+
+    def load(self):
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                for desc, prompt in D_TEMPLATES.items():
+                    self.add('d_templates', desc, prompt, source='builtin')
+                for json_file in self.template_files:
+                    if os.path.exists(json_file):
+                        self.import_records(read_template_file(json_file), source=json_file)
+            self._sync_prompt_dbs()
+            return self
+
+    def _sync_prompt_dbs(self):
+        """导入提示词库里的记录；data_version 没变时什么都不做，相同内容的记录 add 不会重复添加"""
+        from .dbs import get_prompt_store
+
+        for db_path in self.prompt_dbs:
+            store = get_prompt_store(db_path)
+            if not (os.path.exists(db_path) or os.path.exists(store.db_path)):
+                continue
+            data_version = store.data_version()
+            if self._db_versions.get(db_path) != data_version:
+                self._db_versions[db_path] = data_version
+                self.import_records(store.rows(), source=db_path)
+
+    def add(self, key, desc, prompt, source=''):
+        """注册一个模板，返回对应的版本；内容和已有版本相同时不新增版本"""
+        template_id = f'{key}/{desc}'
+        version = self.version_of(prompt)
+        with self._lock:
+            versions = self._versions.setdefault(template_id, [])
+            for template in versions:
+                if template.version == version:
+                    return template
+            template = Template(template_id, key, desc, version, prompt, source)
+            versions.append(template)
+            ids = self._by_key.setdefault(key, [])
+            if template_id not in ids:
+                ids.append(template_id)
+            return template
+
+    def import_records(self, records, source=''):
+        """批量导入 [{'key', 'desc', 'prompt'}, ...]，没有 desc 的记录用序号作为描述"""
+        imported = []
+        for i, record in enumerate(records):
+            if record.get('key') and record.get('prompt') is not None:
+                desc = record.get('desc') or str(i)
+                imported.append(self.add(record['key'], desc, record['prompt'], source=record.get('source') or source))
+        return imported
+
+    def import_file(self, json_file):
+        self.load()
+        return self.import_records(read_template_file(json_file), source=json_file)
+
+    def export_file(self, json_file, all_versions=False):
+        """把模板导出成列表格式的 JSON，可以再用 import_file 导入"""
+        records = [dict(t._asdict()) for t in self.templates(all_versions=all_versions)]
+        if os.path.dirname(json_file):
+            os.makedirs(os.path.dirname(json_file), exist_ok=True)
+        with open(json_file, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False, indent=2)
+        return len(records)
+
+    def get(self, ref):
+        """按 "key/desc" 或 "key/desc@version" 取模板，找不到时抛出 KeyError"""
+        self.load()
+        template_id, _, version = ref.partition('@')
+        with self._lock:
+            versions = self._versions.get(template_id)
+            if not versions:
+                raise KeyError(ref)
+            if not version:
+                return versions[-1]
+            for template in versions:
+                if template.version == version:
+                    return template
+        raise KeyError(ref)
+
+    def by_key(self, key):
+        """某个 key 下所有模板的最新版本，按注册顺序"""
+        self.load()
+        with self._lock:
+            return [self._versions[template_id][-1] for template_id in self._by_key.get(key, [])]
+
+    def templates(self, all_versions=False):
+        self.load()
+        with self._lock:
+            if all_versions:
+                return [t for versions in self._versions.values() for t in versions]
+            return [versions[-1] for versions in self._versions.values()]
+
+
+template_registry = TemplateRegistry()
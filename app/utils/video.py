@@ -0,0 +1,144 @@
+import os
+from bisect import bisect_left
+from collections import namedtuple
+from functools import lru_cache
+
+# 剪辑计划：合并后的 (开始毫秒, 结束毫秒) 区间列表，以及是否可以直接复制码流
+CutPlan = namedtuple('CutPlan', ['intervals', 'stream_copy'])
+
+
+def ms_to_timestamp(ms):
+    """毫秒转成 ffmpeg 的 HH:MM:SS.mmm"""
+    seconds, ms = divmod(int(ms), 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours:02d}:{minutes:02d}:{seconds:02d}.{ms:03d}'
+
+
+def merge_intervals(starts, ends, max_gap_ms=0, pad_ms=0):
+    """
+    按开始时间排序，两端各延长 pad_ms 后，合并重叠或间隔不超过 max_gap_ms 的字幕区间。
+    """
+    merged = []
+    for start, end in sorted(zip(starts, ends)):
+        if end <= start:
+            continue
+        start, end = max(0, start - pad_ms), end + pad_ms
+        if merged and start - merged[-1][1] <= max_gap_ms:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(interval) for interval in merged]
+
+
+def normalize_timeline(starts, ends, max_gap_ms=500, pad_ms=0):
+    """剪辑前统一整理时间线，并打印片段数的减少情况"""
+    intervals = merge_intervals(starts, ends, max_gap_ms=max_gap_ms, pad_ms=pad_ms)
+    if len(starts):
+        print(f'timeline: {len(starts)} subtitles -> {len(intervals)} segments '
+              f'({1 - len(intervals) / len(starts):.0%} fewer, max_gap_ms={max_gap_ms}, pad_ms={pad_ms})')
+    return intervals
+
+
+def get_keyframes(video_file, windows=()):
+    """
+    用 ffprobe 读出视频流关键帧的时间（毫秒）。只看包的 flags，不解码。
+
+    :param windows: [(开始毫秒, 结束毫秒), ...]，只探测这些范围（-read_intervals）；为空时探测整个文件
+    结果按 (路径, mtime, 大小, windows) 缓存，文件被替换后会重新探测。
+    """
+    try:
+        stat = os.stat(video_file)
+    except OSError:
+        return ()
+    return _probe_keyframes(os.path.abspath(video_file), stat.st_mtime_ns, stat.st_size, tuple(windows))
+
+
+@lru_cache(maxsize=16)
+def _probe_keyframes(path, mtime_ns, size, windows):
+    import ffmpeg
+
+    kwargs = {}
+    if windows:
+        kwargs['read_intervals'] = ','.join(f'{max(0, start) / 1000:.3f}%{end / 1000:.3f}' for start, end in windows)
+    try:
+        probe = ffmpeg.probe(path, select_streams='v:0', show_entries='packet=pts_time,flags', **kwargs)
+    except ffmpeg.Error as e:
+        print(e.stderr)
+        return ()
+    return tuple(sorted({round(float(packet['pts_time']) * 1000) for packet in probe.get('packets', [])
+                         if 'K' in packet.get('flags', '') and packet.get('pts_time', 'N/A') != 'N/A'}))
+
+
+def on_keyframe(ms, keyframes, tolerance_ms):
+    i = bisect_left(keyframes, ms - tolerance_ms)
+    return i < len(keyframes) and keyframes[i] <= ms + tolerance_ms
+
+
+def plan_cuts(video_file, intervals, keyframe_tolerance_ms=40):
+    """
+    生成剪辑计划。所有区间都从关键帧开始时可以直接复制码流，否则需要重新编码。
+
+    :param intervals: normalize_timeline 整理后的区间
+    """
+    # 只需要知道每个区间开头附近有没有关键帧
+    windows = [(start - keyframe_tolerance_ms, start + keyframe_tolerance_ms) for start, _ in intervals]
+    keyframes = get_keyframes(video_file, windows) if intervals else ()
+    stream_copy = bool(keyframes) and all(on_keyframe(start, keyframes, keyframe_tolerance_ms) for start, _ in intervals)
+    return CutPlan(list(intervals), stream_copy)
+
+
+@lru_cache(maxsize=4)
+def pick_video_encoder(hw_device='cuda:1'):
+    """能用 GPU 编码时返回 h264_nvenc 及其参数，否则退回 CPU 的 libx264"""
+    import ffmpeg
+
+    try:
+        test = ffmpeg.input('color=size=256x256:duration=0.1', f='lavfi').output(
+            'pipe:', format='null', vcodec='h264_nvenc', init_hw_device=hw_device)
+        ffmpeg.run(test, quiet=True)
+        return ('h264_nvenc', {'init_hw_device': hw_device})
+    except (ffmpeg.Error, OSError):
+        return ('libx264', {'preset': 'veryfast'})
+
+
+def write_concat_list(plan, video_file, list_file):
+    """写 concat demuxer 的文件列表，每个区间用 inpoint/outpoint 指定"""
+    path = os.path.abspath(video_file).replace("'", "'\\''")
+    with open(list_file, 'w', encoding='utf-8') as f:
+        for start, end in plan.intervals:
+            f.write(f"file '{path}'\ninpoint {start / 1000:.3f}\noutpoint {end / 1000:.3f}\n")
+    return list_file
+
+
+def build_preview_output(plan, video_file, output_file, width=640, height=478, hw_device='cuda:1'):
+    """
+    按剪辑计划生成一条 HLS 预览的 ffmpeg 命令。
+
+    两种情况都用 concat demuxer 的 inpoint/outpoint 定位到每个区间，只解码保留的部分：
+    可以复制码流时直接拼接（不缩放）；否则打开 segment_time_metadata，用 concatdec_select
+    丢掉每段 inpoint 之前那几帧，再缩放、重新编码，仍然只跑一次 ffmpeg。
+    """
+    import ffmpeg
+
+    if not plan.intervals:
+        raise ValueError('No subtitle intervals to cut')
+    base = os.path.splitext(output_file)[0]
+    hls_args = dict(format='hls', start_number=0, hls_time=10, hls_list_size=0,
+                    hls_segment_filename=base + '_%05d.ts')
+    list_file = write_concat_list(plan, video_file, base + '.txt')
+    if plan.stream_copy:
+        stream = ffmpeg.input(list_file, format='concat', safe=0)
+        return ffmpeg.overwrite_output(stream.output(output_file, c='copy', **hls_args))
+
+    vcodec, encoder_args = pick_video_encoder(hw_device)
+    stream = ffmpeg.input(list_file, format='concat', safe=0, segment_time_metadata=1)
+    output = stream.output(
+        output_file,
+        vf=f'select=concatdec_select,scale={width}:{height}',
+        af='aselect=concatdec_select',
+        vcodec=vcodec,
+        **encoder_args,
+        **hls_args,
+    )
+    return ffmpeg.overwrite_output(output)
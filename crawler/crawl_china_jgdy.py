@@ -10,9 +10,9 @@ from typing_extensions import override
 from crawlee._request import BaseRequestData
 
 from datetime import datetime, timedelta, timezone
-from typing import TYPE_CHECKING, Any, cast
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, cast
 
-from playwright.async_api import BrowserContext, Page, ProxySettings
+from playwright.async_api import BrowserContext, Page, ProxySettings, Route
 from typing_extensions import override
 
 from crawlee.browsers._base_browser_controller import BaseBrowserController
@@ -20,6 +20,9 @@ from crawlee.browsers._types import BrowserType
 from crawlee.fingerprint_suite import HeaderGenerator
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
 from crawlee import ConcurrencySettings
+from crawlee.storages import Dataset
+
+from crawl_utils import CrawlState, JsonApiClient, TokenBucket
 
 if TYPE_CHECKING:
     from collections.abc import Mapping
@@ -59,11 +62,27 @@ def modify_url_params(url: str, param_modifications: dict) -> str:
     ))
     
     return new_url
+# 详情页只需要 #main_content 的文字，这些资源类型直接拦截
+BLOCKED_RESOURCE_TYPES = ('image', 'media', 'font', 'stylesheet')
+# 只放行这些域名（包括子域名）的请求：东方财富本站和它的静态资源 CDN（emres.dfcfw.com 等），
+# 广告和统计脚本等第三方请求全部拦截
+ALLOWED_DOMAINS = ('eastmoney.com', 'dfcfw.com')
+
 # a new class from PlaywrightBrowserPlugin
 class MyBrowserPlugin(PlaywrightBrowserPlugin):
-    def __init__(self, storage_state, **kwargs):
+    """
+    :param block_resource_types: 拦截的资源类型（Playwright 的 request.resource_type）
+    :param allowed_domains: 为空时不拦截第三方域名
+    :param max_page_uses: 一个页面最多复用几次，超过后真正关闭，避免页面内存一直增长
+    其余参数（max_open_pages_per_browser 等）传给 PlaywrightBrowserPlugin
+    """
+    def __init__(self, storage_state, block_resource_types=BLOCKED_RESOURCE_TYPES, allowed_domains=ALLOWED_DOMAINS,
+                 max_page_uses=20, **kwargs):
         super().__init__(**kwargs)
         self._storage_state = storage_state
+        self._block_resource_types = block_resource_types
+        self._allowed_domains = allowed_domains
+        self._max_page_uses = max_page_uses
 
     @override
     async def new_browser(self) -> PlaywrightBrowserController:
@@ -82,14 +101,36 @@ class MyBrowserPlugin(PlaywrightBrowserPlugin):
         return MyBrowserController(
             self._storage_state,
             browser,
+            block_resource_types=self._block_resource_types,
+            allowed_domains=self._allowed_domains,
+            max_page_uses=self._max_page_uses,
             max_open_pages_per_browser=self._max_open_pages_per_browser,
         )
 
 # a new class from PlaywrightBrowserController
 class MyBrowserController(PlaywrightBrowserController):
-    def __init__(self, storage_state, browser: Browser, **kwargs):
+    """
+    所有页面共用一个带登录状态的浏览器上下文，上下文上挂一个路由拦截，按资源类型和域名拦截请求。
+
+    crawlee 处理完一个请求会关闭页面；这里把页面的 close 换成回收：页面跳到 about:blank 后放回空闲列表，
+    下一个请求直接复用，用满 max_page_uses 次后才真正关闭。空闲页面也计入 max_open_pages_per_browser。
+    """
+    def __init__(self, storage_state, browser: Browser, block_resource_types=BLOCKED_RESOURCE_TYPES,
+                 allowed_domains=ALLOWED_DOMAINS, max_page_uses=20, **kwargs):
         super().__init__(browser, **kwargs)
         self._storage_state = storage_state
+        self._block_resource_types = frozenset(block_resource_types or ())
+        self._allowed_domains = tuple(allowed_domains or ())
+        self._max_page_uses = max_page_uses
+        self._idle_pages: list[Page] = []
+        self._page_uses: dict[Page, int] = {}
+
+    @property
+    @override
+    def has_free_capacity(self) -> bool:
+        # 有空闲页面时直接复用；否则打开的和空闲的页面合起来不能超过上限
+        return bool(self._idle_pages) or len(self._pages) + len(self._idle_pages) < self._max_open_pages_per_browser
+
     @override
     async def new_page(
         self,
@@ -99,20 +140,63 @@ class MyBrowserController(PlaywrightBrowserController):
         if not self._browser_context:
             self._browser_context = await self._create_browser_context_with_state(self._storage_state, proxy_info)
 
+        self._idle_pages = [idle for idle in self._idle_pages if not idle.is_closed()]
         if not self.has_free_capacity:
             raise ValueError('Cannot open more pages in this browser.')
 
-        page_options = dict(page_options) if page_options else {}
-        page = await self._browser_context.new_page(**page_options)
+        page = self._idle_pages.pop() if self._idle_pages else None
+        if page is None:
+            page_options = dict(page_options) if page_options else {}
+            page = await self._browser_context.new_page(**page_options)
 
-        # Handle page close event
-        page.on(event='close', f=self._on_page_close)
+            # Handle page close event
+            page.on(event='close', f=self._on_page_close)
+            self._recycle_on_close(page)
 
         # Update internal state
         self._pages.append(page)
+        self._page_uses[page] = self._page_uses.get(page, 0) + 1
         self._last_page_opened_at = datetime.now(timezone.utc)
 
         return page
+
+    def _recycle_on_close(self, page: Page) -> None:
+        close = page.close
+
+        async def recycle(*args, **kwargs) -> None:
+            if self._page_uses.get(page, 0) >= self._max_page_uses or len(self._idle_pages) >= self._max_open_pages_per_browser:
+                await close(*args, **kwargs)
+                return
+            try:
+                await page.goto('about:blank')
+            except Exception:
+                await close(*args, **kwargs)
+                return
+            if page in self._pages:
+                self._pages.remove(page)
+            self._idle_pages.append(page)
+
+        page.close = recycle
+
+    @override
+    def _on_page_close(self, page: Page) -> None:
+        if page in self._pages:
+            self._pages.remove(page)
+        if page in self._idle_pages:
+            self._idle_pages.remove(page)
+        self._page_uses.pop(page, None)
+
+    async def _route(self, route: Route) -> None:
+        request = route.request
+        if request.resource_type in self._block_resource_types:
+            await route.abort()
+            return
+        host = urlparse(request.url).hostname
+        if host and self._allowed_domains and not any(host == d or host.endswith('.' + d) for d in self._allowed_domains):
+            await route.abort()
+            return
+        await route.continue_()
+
     async def _create_browser_context_with_state(self, storage_state, proxy_info: ProxyInfo | None = None) -> BrowserContext:
         """Create a new browser context with the specified proxy settings."""
         if self._header_generator:
@@ -142,8 +226,96 @@ class MyBrowserController(PlaywrightBrowserController):
             proxy=proxy,
         )
         await context.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        if self._block_resource_types or self._allowed_domains:
+            await context.route('**/*', self._route)
         return context
 
+LIST_URL = 'https://datacenter-web.eastmoney.com/api/data/v1/get?sortColumns=NOTICE_DATE%2CSUM%2CRECEIVE_START_DATE%2CSECURITY_CODE&sortTypes=-1%2C-1%2C-1%2C1&pageSize=50&pageNumber=1&reportName=RPT_ORG_SURVEYNEW&columns=SECUCODE%2CSECURITY_CODE%2CSECURITY_NAME_ABBR%2CNOTICE_DATE%2CRECEIVE_START_DATE%2CRECEIVE_PLACE%2CRECEIVE_WAY_EXPLAIN%2CRECEPTIONIST%2CSUM&quoteColumns=f2~01~SECURITY_CODE~CLOSE_PRICE%2Cf3~01~SECURITY_CODE~CHANGE_RATE&quoteType=0&source=WEB&client=WEB&filter=(NUMBERNEW%3D%221%22)(IS_SOURCE%3D%221%22)(RECEIVE_START_DATE%3E%272021-12-16%27)'
+STORAGE_STATE = './crawler/state.json'
+# 增量爬取的状态：上次见到的最新 NOTICE_DATE 和已经抓过的详情页
+CRAWL_STATE = './crawler/jgdy_crawl_state.json'
+# 列表接口的请求速率：平均每秒 2 个，最多连续 4 个
+LIST_RATE_PER_SEC = 2
+LIST_BURST = 4
+# 每个浏览器同时打开的详情页数
+MAX_OPEN_PAGES_PER_BROWSER = 5
+# 重试后仍然失败的详情页在之后几次运行里按键重新抓取，失败这么多次后放弃
+MAX_DETAIL_ATTEMPTS = 3
+
+
+def incremental_list_url(url: str, state: CrawlState) -> str:
+    """有 high_water 时在接口的 filter 里只取 NOTICE_DATE 不早于它的记录"""
+    if not state.high_water:
+        return url
+    list_filter = parse_qs(urlparse(url).query)['filter'][0]
+    return modify_url_params(url, {'filter': f"{list_filter}(NOTICE_DATE>='{state.high_water}')"})
+
+def detail_key(url: str) -> str:
+    """详情页的键 {SECURITY_CODE},{RECEIVE_START_DATE}"""
+    return url.split('/')[-1].removesuffix('.html')
+
+def detail_request(para: str) -> BaseRequestData:
+    return BaseRequestData.from_url(f'https://data.eastmoney.com/jgdy/dyxx/{para}.html', user_data={'label':'DETAIL'})
+
+def list_page_details(result: dict, state: CrawlState, queued: set[str]) -> list[BaseRequestData]:
+    """
+    列表页里每一行对应的详情页（DETAIL）请求。
+
+    同一次调研（{SECURITY_CODE},{RECEIVE_START_DATE}）常常在列表里出现好几行，
+    本次已经入队的和以前已经抓过的都跳过，每个详情页只渲染一次。
+    """
+    detail_requests = []
+    for stock in result.get('data') or []:
+        state.observe(stock['NOTICE_DATE'].split(' ')[0])
+        SECURITY_CODE = stock['SECURITY_CODE']
+        RECEIVE_START_DATE = stock['RECEIVE_START_DATE'].split(' ')[0]
+        para = f'{SECURITY_CODE},{RECEIVE_START_DATE}'
+        if para in queued or state.is_done(para):
+            continue
+        queued.add(para)
+        detail_requests.append(detail_request(para))
+    return detail_requests
+
+async def crawl_list_pages(client: JsonApiClient, url: str, dataset: Dataset, state: CrawlState,
+                           add_requests: Callable[[list[BaseRequestData]], Awaitable[Any]]) -> tuple[set[str], list[str]]:
+    """
+    直接请求列表接口（LIST），逐页保存原始 JSON，每一页的详情页（DETAIL）请求一次批量入队，
+    返回 (本次入队的所有详情页键, 失败的列表页 URL)。
+
+    列表接口返回的就是 JSON，不需要浏览器渲染，用带连接池的 HTTP 客户端读取。
+    第一页返回总页数 result.pages 后，其余页一次全部发出，并发数由客户端的连接池、
+    请求速率由客户端的令牌桶限制。
+
+    增量爬取时接口只返回 high_water 之后的记录，总页数通常只有几页。
+    某一页重试后仍然失败时只记录下来，不影响其余页和已经入队的详情页。
+    """
+    queued = set()
+
+    async def fetch(page_url: str) -> tuple[int, dict]:
+        response_json, text = await client.get_json(page_url)
+        page_value = int(parse_qs(urlparse(page_url).query).get('pageNumber', ['1'])[0])
+        await dataset.push_data({'url': page_url, 'title': '', 'response': text, 'page_num': page_value})
+        result = response_json.get('result') or {}
+        detail_requests = list_page_details(result, state, queued)
+        if detail_requests:
+            await add_requests(detail_requests)
+        return page_value, result
+
+    list_url = incremental_list_url(url, state)
+    first_page, result = await fetch(list_url)
+    # pageNumber 从 1 开始，pages 是总页数
+    max_pages = result.get('pages', 0)
+    print(f'Page value is {first_page}, and max page is {max_pages} ...')
+    rest = [modify_url_params(list_url, {'pageNumber': page}) for page in range(first_page + 1, max_pages + 1)]
+    results = await asyncio.gather(*(fetch(page_url) for page_url in rest), return_exceptions=True)
+    failed = []
+    for page_url, page_result in zip(rest, results):
+        if isinstance(page_result, BaseException):
+            print(f'List page failed: {page_url}: {page_result!r}')
+            failed.append(page_url)
+    print(f'Fetched {len(rest) + 1 - len(failed)} list pages ({len(failed)} failed), {len(queued)} detail pages queued')
+    return queued, failed
+
 async def main() -> None:
     concurrency_settings = ConcurrencySettings(
         # Start with 8 concurrent tasks, as long as resources are available.
@@ -154,66 +326,26 @@ async def main() -> None:
         # overloading the system.
         max_tasks_per_minute=40,
     )
-    # 初始化爬虫
-    browser_pool = BrowserPool(plugins=[MyBrowserPlugin(storage_state='./crawler/state.json', browser_options={"headless":True} )])
+    # 只有详情页需要浏览器渲染
+    browser_pool = BrowserPool(plugins=[MyBrowserPlugin(storage_state=STORAGE_STATE, browser_options={"headless":True},
+                                                        max_open_pages_per_browser=MAX_OPEN_PAGES_PER_BROWSER)])
     crawler = PlaywrightCrawler(concurrency_settings=concurrency_settings, browser_pool=browser_pool, max_requests_per_crawl=1000)
+    state = CrawlState(CRAWL_STATE)
+    print(f'high water NOTICE_DATE: {state.high_water}, {len(state.done)} detail pages done')
+
+    # 重试后仍然失败的详情页记在状态里，不阻止 high_water 前进，下次运行按键重新抓取
+    @crawler.failed_request_handler
+    async def failed_handler(context, error: Exception) -> None:
+        context.log.error(f'Detail page failed: {context.request.url}: {error!r}')
+        if context.request.label == 'DETAIL':
+            state.mark_failed(detail_key(context.request.url))
 
     # Define the default request handler, which will be called for every request.
     @crawler.router.default_handler
     async def request_handler(context: PlaywrightCrawlingContext) -> None:
         context.log.info(f'Processing {context.request.url} ...')
 
-
-        # Push the extracted data to the default dataset.
-        if context.request.label == 'LIST' or context.request.label == None :
-            #await context.response.body()
-            json_data = await context.page.locator('pre').text_content()
-            # Extract data from the page.
-            data = {
-                'url': context.request.url,
-                'title': await context.page.title(),
-                'response': json_data, #await context.page.content() #(await context.response.text()),
-                'page_num':0
-            }
-            context.log.info(f'Processing {context.request.url} ...')
-            
-
-            # convert 'response' to json object
-            #print(f'data is {data}')
-            response_json = json.loads(data['response'])
-            parsed_url = urlparse(context.request.url)
-            query_params = parse_qs(parsed_url.query)
-            page_value = query_params.get('pageNumber', [None])[0]
-            max_pages = response_json["result"]['pages']
-
-            data['page_num'] = int(page_value)
-            await context.push_data(data, dataset_name='JGDY_Crawl_List')
-
-            context.log.info(f'Page value is {page_value}, and max page is {max_pages} ...')
-            if int(page_value) == max_pages - 1 :
-                context.log.info(f'Exit! Page value is {page_value}, and max page is {max_pages} ...')
-                return 
-            # 替换url参数
-            param_modifications = {
-                'pageNumber': int(page_value) + 1
-            }
-            new_url = modify_url_params(context.request.url, param_modifications)
-            # sleep 5 seconds
-            #await asyncio.sleep(5)
-            request = BaseRequestData.from_url(new_url, user_data={'label':'LIST'})
-            await context.add_requests([request])
-
-            for stock in response_json["result"]["data"]:
-                SECURITY_CODE = stock['SECURITY_CODE']
-                RECEIVE_START_DATE = stock['RECEIVE_START_DATE'].split(' ')[0]
-                para = f'{SECURITY_CODE},{RECEIVE_START_DATE}'
-                uri = f'https://data.eastmoney.com/jgdy/dyxx/{para}.html'
-                request = BaseRequestData.from_url(uri, user_data={'label':'DETAIL'})
-                await context.add_requests([request])
-                #break
-        
         if context.request.label == 'DETAIL':
-            context.log.info(f'Processing {context.request.url} ...')
             await context.page.wait_for_selector('#main_content')
             content = await context.page.locator('#main_content').text_content()
             #获得url 最后一个/之后的内容
@@ -226,14 +358,29 @@ async def main() -> None:
             }
             #await asyncio.sleep(2)
             await context.push_data(data, dataset_name='JGDY_Crawl_Detail')
+            state.mark_done(detail_key(context.request.url))
         #context.enqueue_links()
 
+    # 列表页用 HTTP 客户端读取，cookie 和浏览器共用同一个 storage_state；详情页按列表页分批入队
+    list_dataset = await Dataset.open(name='JGDY_Crawl_List')
+    async with JsonApiClient(storage_state=STORAGE_STATE, headers={'Referer': 'https://data.eastmoney.com/jgdy/'},
+                             max_connections=5, limiter=TokenBucket(LIST_RATE_PER_SEC, LIST_BURST)) as client:
+        queued, failed_pages = await crawl_list_pages(client, LIST_URL, list_dataset, state, crawler.add_requests)
+    retry = [key for key in state.retry_keys(MAX_DETAIL_ATTEMPTS) if key not in queued]
+    if retry:
+        print(f'Retrying {len(retry)} detail pages that failed in earlier runs')
+        queued.update(retry)
+        await crawler.add_requests([detail_request(key) for key in retry])
 
-    # 使用 Playwright 恢复上下文
-    from playwright.async_api import async_playwright
-
- 
-    await crawler.run(['https://datacenter-web.eastmoney.com/api/data/v1/get?sortColumns=NOTICE_DATE%2CSUM%2CRECEIVE_START_DATE%2CSECURITY_CODE&sortTypes=-1%2C-1%2C-1%2C1&pageSize=50&pageNumber=1&reportName=RPT_ORG_SURVEYNEW&columns=SECUCODE%2CSECURITY_CODE%2CSECURITY_NAME_ABBR%2CNOTICE_DATE%2CRECEIVE_START_DATE%2CRECEIVE_PLACE%2CRECEIVE_WAY_EXPLAIN%2CRECEPTIONIST%2CSUM&quoteColumns=f2~01~SECURITY_CODE~CLOSE_PRICE%2Cf3~01~SECURITY_CODE~CHANGE_RATE&quoteType=0&source=WEB&client=WEB&filter=(NUMBERNEW%3D%221%22)(IS_SOURCE%3D%221%22)(RECEIVE_START_DATE%3E%272021-12-16%27)'])
+    try:
+        await crawler.run()
+    finally:
+        # 列表页全部读到、所有详情页都处理过（抓到了，或者重试后失败、记进了 failed）才推进 high_water，
+        # 否则下次还会从上次的位置重新列出没抓到的
+        if not failed_pages and all(state.is_done(key) or key in state.failed for key in queued):
+            state.commit()
+        else:
+            state.save()
     #await crawler.export_data_json(path='results.json', ensure_ascii=False)
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
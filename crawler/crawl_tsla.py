@@ -6,6 +6,10 @@ from crawlee.playwright_crawler import PlaywrightCrawler, PlaywrightCrawlingCont
 import json
 from crawlee.browsers import PlaywrightBrowserPlugin, BrowserPool
 from crawlee.browsers._playwright_browser_controller import PlaywrightBrowserController
+from crawlee._request import BaseRequestData
+from crawlee import ConcurrencySettings
+
+from crawl_utils import CrawlState
 from typing_extensions import override
 
 
@@ -143,10 +147,31 @@ class MyBrowserController(PlaywrightBrowserController):
         await context.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
         return context
 
+# 雪球接口的访问速率上限
+PAGES_PER_MINUTE = 20
+START_URL = 'https://xueqiu.com/query/v1/symbol/search/status.json?count=10&comment=0&symbol=TSLA&hl=0&source=all&sort=time&page=99'
+# 增量爬取的状态：上次见到的最新帖子时间 created_at（毫秒）
+CRAWL_STATE = 'tsla_crawl_state.json'
+
 async def main() -> None:
+    state = CrawlState(CRAWL_STATE)
+    # 有 high_water 时从第一页（最新的帖子）开始，翻到上次见过的位置为止
+    start_url = modify_url_params(START_URL, {'page': 1}) if state.high_water is not None else START_URL
     # 初始化爬虫
     browser_pool = BrowserPool(plugins=[MyBrowserPlugin(storage_state='state.json', browser_options={"headless":False} )])
-    crawler = PlaywrightCrawler(browser_pool=browser_pool, max_requests_per_crawl=200)
+    # 翻页请求一次全部入队后由 crawlee 并发处理；速率限制放在打开页面之前（每分钟最多 PAGES_PER_MINUTE 个任务），
+    # 代替原来处理函数里的 sleep(5)
+    concurrency_settings = ConcurrencySettings(desired_concurrency=4, max_concurrency=4, max_tasks_per_minute=PAGES_PER_MINUTE)
+    crawler = PlaywrightCrawler(concurrency_settings=concurrency_settings, browser_pool=browser_pool, max_requests_per_crawl=200)
+    # 入队和处理完成的页面，用来判断这次是否完整跑完（失败的页、超过 max_requests_per_crawl 没处理的页）
+    enqueued = {start_url}
+    handled = set()
+    failed = set()
+
+    @crawler.failed_request_handler
+    async def failed_handler(context, error: Exception) -> None:
+        context.log.error(f'Page failed: {context.request.url}: {error!r}')
+        failed.add(context.request.url)
 
     # Define the default request handler, which will be called for every request.
     @crawler.router.default_handler
@@ -164,24 +189,35 @@ async def main() -> None:
         # Push the extracted data to the default dataset.
         await context.push_data(data, dataset_name='TSLA_Crawl_Test')
 
-        # convert 'response' to json object
-        #print(f'data is {data}')
         response_json = json.loads(data['response'])
         parsed_url = urlparse(context.request.url)
         query_params = parse_qs(parsed_url.query)
-        page_value = query_params.get('page', [None])[0]
-        context.log.info(f'Page value is {page_value}, and max page is {response_json["maxPage"]} ...')
-        if int(page_value) == response_json["maxPage"] - 1 :
-            context.log.info(f'Exit! Page value is {page_value}, and max page is {response_json["maxPage"]} ...')
-            return 
-        # 替换url参数
-        param_modifications = {
-            'page': int(page_value) + 1
-        }
-        new_url = modify_url_params(context.request.url, param_modifications)
-        # sleep 5 seconds
-        await asyncio.sleep(5)
-        await context.add_requests([new_url])
+        page_value = int(query_params.get('page', ['1'])[0])
+        max_page = response_json["maxPage"]
+        created = [post['created_at'] for post in response_json.get('list', [])]
+        for created_at in created:
+            state.observe(created_at)
+        context.log.info(f'Page value is {page_value}, and max page is {max_page} ...')
+
+        if state.high_water is not None:
+            # 增量爬取：帖子按时间倒序，这一页已经到了上次见过的时间就不再翻页
+            if created and min(created) > state.high_water and page_value < max_page:
+                next_url = modify_url_params(context.request.url, {'page': page_value + 1})
+                enqueued.add(next_url)
+                await context.add_requests([BaseRequestData.from_url(next_url, user_data={'label': 'PAGE'})])
+            handled.add(context.request.url)
+            return
+
+        # 只有第一页负责翻页：按 maxPage 把剩下的页一次全部入队
+        if context.request.label is None:
+            requests = [
+                BaseRequestData.from_url(modify_url_params(context.request.url, {'page': page}), user_data={'label': 'PAGE'})
+                for page in range(page_value + 1, max_page + 1)
+            ]
+            enqueued.update(request.url for request in requests)
+            if requests:
+                await context.add_requests(requests)
+        handled.add(context.request.url)
         # # 解析发帖内容
         # posts = []
         # for post in context.soup.select('.article__bd'):
@@ -233,7 +269,16 @@ async def main() -> None:
     #     # }
 
         # # 开始爬虫
-    await crawler.run(['https://xueqiu.com/query/v1/symbol/search/status.json?count=10&comment=0&symbol=TSLA&hl=0&source=all&sort=time&page=99'])
+    try:
+        await crawler.run([start_url])
+    finally:
+        # 和 JGDY 一样：所有入队的页都处理成功才推进 high_water，否则下次还从上次的位置开始
+        unfinished = enqueued - handled
+        if not failed and not unfinished:
+            state.commit()
+        else:
+            print(f'{len(failed)} pages failed, {len(unfinished)} pages not crawled; high water not advanced')
+            state.save()
 
 if __name__ == '__main__':
     asyncio.run(main())
\ No newline at end of file
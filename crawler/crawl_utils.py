@@ -0,0 +1,180 @@
+"""
+爬虫脚本共用的工具：直接用 HTTP 读取 JSON 接口（不需要为了读 <pre> 里的 JSON 打开浏览器页面），
+所有并发请求共用的令牌桶限速，以及增量爬取的持久化状态。
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+from typing import Any
+
+import httpx
+
+DEFAULT_HEADERS = {
+    'User-Agent': ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                   '(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36'),
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+}
+
+
+def load_storage_cookies(storage_state: str | dict | None) -> httpx.Cookies:
+    """把 Playwright 的 storage_state（文件路径或 dict）里的 cookie 转成 httpx 的 Cookies"""
+    cookies = httpx.Cookies()
+    if not storage_state:
+        return cookies
+    if isinstance(storage_state, str):
+        with open(storage_state, 'r', encoding='utf-8') as f:
+            storage_state = json.load(f)
+    for cookie in storage_state.get('cookies', []):
+        cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain', ''), path=cookie.get('path', '/'))
+    return cookies
+
+
+class TokenBucket:
+    """
+    令牌桶限速：平均每秒 rate 个请求，最多连续 burst 个。
+
+    所有并发任务共用一个实例，代替在处理函数里固定 sleep；等待的任务按先后顺序拿到令牌。
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = None
+
+    async def acquire(self, tokens: int = 1) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class JsonApiClient:
+    """
+    带连接池的异步 JSON 接口客户端，cookie 从浏览器的 storage_state 导入，
+    这样列表接口和 Playwright 打开的详情页使用同一个登录状态。
+
+    连接失败、超时或服务端 5xx 时按指数退避重试。每次请求（包括重试）之前先从 limiter 取令牌。
+    """
+
+    def __init__(self, storage_state=None, headers=None, max_connections=10, timeout=30.0, retries=3, backoff=1.0,
+                 limiter: TokenBucket | None = None):
+        self.storage_state = storage_state
+        self.limiter = limiter
+        self.headers = dict(DEFAULT_HEADERS, **(headers or {}))
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._client = None
+
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                cookies=load_storage_cookies(self.storage_state),
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                follow_redirects=True,
+            )
+        return self._client
+
+    async def get_text(self, url: str) -> str:
+        for attempt in range(self.retries + 1):
+            if self.limiter is not None:
+                await self.limiter.acquire()
+            try:
+                response = await self.client().get(url)
+                response.raise_for_status()
+                return response.text
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                retryable = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code >= 500
+                if not retryable or attempt == self.retries:
+                    raise
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def get_json(self, url: str) -> tuple[Any, str]:
+        """返回 (解析后的 JSON, 原始文本)"""
+        text = await self.get_text(url)
+        return json.loads(text), text
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __aenter__(self) -> JsonApiClient:
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+
+class CrawlState:
+    """
+    增量爬取的状态，保存在一个 JSON 文件里：
+
+    - high_water：上次完整跑完时见到的最新时间（JGDY 的 NOTICE_DATE、雪球帖子的 created_at），
+      下次只爬比它新（或相同）的记录
+    - done：已经抓过的详情页键，不再重复抓取
+    - failed：重试后仍然失败的详情页键 -> 失败的次数，之后的运行按键重新抓取，
+      不会因为一个已经删除的页面让 high_water 永远停在原地
+
+    high_water 只在 commit() 时更新，中途中断的运行不会跳过没有抓完的数据。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        data = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        self.high_water = data.get('high_water')
+        self.done = set(data.get('done', []))
+        self.failed = dict(data.get('failed', {}))
+        self._pending_high_water = self.high_water
+
+    def is_done(self, key: str) -> bool:
+        return key in self.done
+
+    def mark_done(self, key: str) -> None:
+        self.done.add(key)
+        self.failed.pop(key, None)
+
+    def mark_failed(self, key: str) -> None:
+        self.failed[key] = self.failed.get(key, 0) + 1
+
+    def retry_keys(self, max_attempts: int) -> list[str]:
+        """失败次数还没有达到 max_attempts 的键"""
+        return sorted(key for key, attempts in self.failed.items() if attempts < max_attempts and key not in self.done)
+
+    def observe(self, value) -> None:
+        """记录本次见到的时间，commit() 时成为新的 high_water"""
+        if value is not None and (self._pending_high_water is None or value > self._pending_high_water):
+            self._pending_high_water = value
+
+    def commit(self) -> None:
+        self.high_water = self._pending_high_water
+        self.save()
+
+    def save(self) -> None:
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        part = self.path + '.part'
+        with open(part, 'w', encoding='utf-8') as f:
+            json.dump({'high_water': self.high_water, 'done': sorted(self.done), 'failed': self.failed}, f,
+                      ensure_ascii=False)
+        os.replace(part, self.path)